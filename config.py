@@ -21,7 +21,21 @@ STRING_SESSIONS = [
 # Chat ID of the Telegram storage channel where files will be stored
 STORAGE_CHANNEL = int(os.getenv("STORAGE_CHANNEL", ""))  # Your storage channel's chat ID
 
-# Message ID of a file in the storage channel used for storing database backups
+# Chat IDs of all storage channels new files are spread across, defaults to STORAGE_CHANNEL.
+# Files uploaded before more channels were added stay readable from STORAGE_CHANNEL
+STORAGE_CHANNELS = os.getenv("STORAGE_CHANNELS", "").strip(", ").split(",")
+STORAGE_CHANNELS = [int(id) for id in STORAGE_CHANNELS if id.strip() != ""]
+if len(STORAGE_CHANNELS) == 0:
+    STORAGE_CHANNELS = [STORAGE_CHANNEL]
+
+# How new uploads pick a storage channel: "round_robin", "lru" (least recently
+# used channel) or "size" (channel holding the fewest bytes)
+STORAGE_PLACEMENT = os.getenv("STORAGE_PLACEMENT", "round_robin").lower()
+
+# Chat ID of the channel holding the database backup message, defaults to STORAGE_CHANNEL
+BACKUP_CHANNEL = int(os.getenv("BACKUP_CHANNEL", "") or STORAGE_CHANNEL)
+
+# Message ID of a file in the backup channel used for storing database backups
 DATABASE_BACKUP_MSG_ID = int(
     os.getenv("DATABASE_BACKUP_MSG_ID", "2")
 )  # Message ID for database backup
@@ -29,12 +43,16 @@ DATABASE_BACKUP_MSG_ID = int(
 # Password used to access the website's admin panel
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin")  # Default to "admin" if not set
 
-# Determine the maximum file size (in bytes) allowed for uploading to Telegram
+# Determine the maximum file size (in bytes) a single Telegram message can hold
 # 1.98 GB if no premium sessions are provided, otherwise 3.98 GB
 if len(STRING_SESSIONS) == 0:
-    MAX_FILE_SIZE = 1.98 * 1024 * 1024 * 1024  # 2 GB in bytes
+    TELEGRAM_FILE_SIZE_LIMIT = 1.98 * 1024 * 1024 * 1024  # 2 GB in bytes
 else:
-    MAX_FILE_SIZE = 3.98 * 1024 * 1024 * 1024  # 4 GB in bytes
+    TELEGRAM_FILE_SIZE_LIMIT = 3.98 * 1024 * 1024 * 1024  # 4 GB in bytes
+
+# Maximum file size (in GBs) allowed for uploading to the drive
+# Files larger than TELEGRAM_FILE_SIZE_LIMIT are split into multiple Telegram messages
+MAX_FILE_SIZE = float(os.getenv("MAX_FILE_SIZE", 20)) * 1024 * 1024 * 1024
 
 # Database backup interval in seconds. Backups will be sent to the storage channel at this interval
 DATABASE_BACKUP_TIME = int(
@@ -44,6 +62,28 @@ DATABASE_BACKUP_TIME = int(
 # Time delay in seconds before retrying after a Telegram API floodwait error
 SLEEP_THRESHOLD = int(os.getenv("SLEEP_THRESHOLD", 60))  # Default to 60 seconds
 
+# Remote URL imports running at once, in total and against a single host
+REMOTE_IMPORT_CONCURRENCY = int(os.getenv("REMOTE_IMPORT_CONCURRENCY", 4))
+REMOTE_IMPORT_PER_HOST = int(os.getenv("REMOTE_IMPORT_PER_HOST", 2))
+
+# Admission control for file streaming, 0 disables a limit. Concurrent streams
+# in total, from a single client IP and through a single share link
+STREAM_MAX_CONCURRENT = int(os.getenv("STREAM_MAX_CONCURRENT", 64))
+STREAM_MAX_PER_CLIENT = int(os.getenv("STREAM_MAX_PER_CLIENT", 0))
+STREAM_MAX_PER_SHARE = int(os.getenv("STREAM_MAX_PER_SHARE", 16))
+
+# Streaming bandwidth allowed to a single client IP, in MB/s
+STREAM_CLIENT_BANDWIDTH = float(os.getenv("STREAM_CLIENT_BANDWIDTH", 0))
+
+# Header the reverse proxy in front of the app puts the client IP in, e.g.
+# X-Forwarded-For. Behind a proxy every request otherwise shares its address,
+# which turns the per client limits above into global ones
+CLIENT_IP_HEADER = os.getenv("CLIENT_IP_HEADER", "").strip()
+
+# Re-request file chunks that are slower than usual over a second connection
+# and use whichever answer arrives first, trades a little traffic for fewer stalls
+HEDGED_REQUESTS = os.getenv("HEDGED_REQUESTS", "False").lower() == "true"
+
 # Domain to auto-ping and keep the website active
 WEBSITE_URL = os.getenv("WEBSITE_URL", "")
 
@@ -1,26 +1,55 @@
-from utils.downloader import download_file, get_file_info_from_url
-import asyncio
+from utils.downloader import (
+    close_http_session,
+    download_file,
+    download_files,
+    get_file_info_from_url,
+)
+import asyncio, base64, hashlib
 from pathlib import Path
 from contextlib import asynccontextmanager
 import aiofiles
 from fastapi import FastAPI, HTTPException, Request, File, UploadFile, Form
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from config import ADMIN_PASSWORD, MAX_FILE_SIZE, STORAGE_CHANNEL
-from utils.clients import initialize_clients
+from config import ADMIN_PASSWORD, MAX_FILE_SIZE
+from utils.admission import STREAM_ADMISSION
+from utils.clients import get_stream_stats, initialize_clients
 from utils.directoryHandler import getRandomID
 from utils.extra import auto_ping_website, convert_class_to_dict, reset_cache_dir
-from utils.streamer import media_streamer
-from utils.uploader import start_file_uploader
+from utils.folder_index import SORT_KEYS
+from utils.listing_cache import LISTING_CACHE, dumps
+from utils.streamer import (
+    immutable_headers,
+    media_streamer,
+    WARM_BATCH_SIZE,
+    prewarm_media_sessions,
+    should_warm,
+    stop_streamers,
+    warm_listing,
+)
+from utils.streamer.thumbnails import get_thumbnail, get_thumbnails
+from utils.streamer.zip_reader import list_zip_members, zip_member_streamer
+from utils.streamer.zip_stream import zip_streamer
+from utils.uploader import hash_file, start_file_uploader
+from utils.upload_sessions import (
+    UPLOAD_SESSIONS,
+    create_upload_session,
+    load_upload_sessions,
+)
+from utils.jobs import JOBS
 from utils.logger import Logger
 import urllib.parse
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     reset_cache_dir()
+    load_upload_sessions()
     await initialize_clients()
+    asyncio.create_task(prewarm_media_sessions())
     asyncio.create_task(auto_ping_website())
     yield
+    await stop_streamers()
+    await close_http_session()
     
 app = FastAPI(docs_url=None, redoc_url=None, lifespan=lifespan)
 logger = Logger(__name__)
@@ -34,6 +63,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def is_authorized(password: str, auth: str, item_id: str) -> bool:
+    """Admins, and visitors of a shared folder the item lies in"""
+    from utils.directoryHandler import DRIVE_DATA
+    if password == ADMIN_PASSWORD:
+        return True
+    return DRIVE_DATA.get_shared_folder(auth, item_id) is not None
+
+def get_share_id(password: str, auth: str, item_id: str):
+    """Id of the shared folder a visitor reaches the item through, None for admins"""
+    from utils.directoryHandler import DRIVE_DATA
+    if password == ADMIN_PASSWORD:
+        return None
+    shared_folder = DRIVE_DATA.get_shared_folder(auth, item_id)
+    return shared_folder.id if shared_folder else None
+
 # --- BASE ROUTES ---
 
 @app.get("/")
@@ -47,11 +91,113 @@ async def dl_file(request: Request):
     try:
         path = request.query_params["path"]
         file = DRIVE_DATA.get_file(path)
-        return await media_streamer(STORAGE_CHANNEL, file.file_id, file.name, request)
+        return await STREAM_ADMISSION.admit(
+            request,
+            lambda: media_streamer(
+                file.channel, file.file_id, file.name, request, file.parts
+            ),
+        )
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+
+
+@app.get("/f/{content_id}/{filename}")
+async def dl_file_immutable(content_id: str, filename: str, request: Request):
+    """
+    Streams a file by the id of its content rather than its drive path, so the
+    URL survives renames and moves and can be cached forever by a CDN
+    """
+    from utils.directoryHandler import DRIVE_DATA
+    try:
+        file = DRIVE_DATA.get_file_by_content_id(content_id)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+
+    # If-None-Match compares ETags weakly, so W/"..." matches too
+    etag = f'"{content_id}"'
+    etags = [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]
+    if "*" in etags or etag in etags or f"W/{etag}" in etags:
+        return Response(status_code=304, headers=immutable_headers(content_id))
+
+    return await STREAM_ADMISSION.admit(
+        request,
+        lambda: media_streamer(
+            file.channel, file.file_id, filename, request, file.parts, content_id
+        ),
+    )
+
+
+@app.get("/folder.zip")
+async def dl_folder_zip(request: Request):
+    """Streams a folder and everything below it as a ZIP archive"""
+    from utils.directoryHandler import DRIVE_DATA
+    try:
+        path = request.query_params["path"]
+        if "/share_" in path:
+            is_admin = request.query_params.get("password") == ADMIN_PASSWORD
+            result = DRIVE_DATA.get_directory(
+                path.split("_", 1)[1], is_admin, request.query_params.get("auth")
+            )
+            if result is None:
+                return JSONResponse({"error": "Unauthorized"}, status_code=403)
+            folder = result[0] if isinstance(result, tuple) else result
+        elif request.query_params.get("password") == ADMIN_PASSWORD:
+            folder = DRIVE_DATA.get_directory(path)
+        else:
+            return JSONResponse({"error": "Unauthorized"}, status_code=403)
+        share = get_share_id(
+            request.query_params.get("password"), request.query_params.get("auth"), folder.id
+        )
+        return await STREAM_ADMISSION.admit(
+            request, lambda: zip_streamer(folder, request), share
+        )
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+
+
+@app.get("/zip/member")
+async def dl_zip_member(request: Request):
+    """Streams a single member out of a ZIP archive stored on the drive"""
+    from utils.directoryHandler import DRIVE_DATA
+    try:
+        file = DRIVE_DATA.get_file(request.query_params["path"])
+        password = request.query_params.get("password")
+        auth = request.query_params.get("auth")
+        if not is_authorized(password, auth, file.id):
+            return JSONResponse({"error": "Unauthorized"}, status_code=403)
+
+        return await STREAM_ADMISSION.admit(
+            request,
+            lambda: zip_member_streamer(file, request.query_params["name"], request),
+            get_share_id(password, auth, file.id),
+        )
     except Exception as e:
         return JSONResponse({"error": str(e)}, status_code=404)
 
 
+@app.get("/thumb")
+async def dl_thumb(request: Request):
+    """Serves the Telegram generated thumbnail of an image or video"""
+    from utils.directoryHandler import DRIVE_DATA
+    try:
+        file = DRIVE_DATA.get_file(request.query_params["path"])
+        if not is_authorized(
+            request.query_params.get("password"), request.query_params.get("auth"), file.id
+        ):
+            return JSONResponse({"error": "Unauthorized"}, status_code=403)
+        data = await get_thumbnail(file)
+    except Exception as e:
+        return JSONResponse({"error": str(e)}, status_code=404)
+
+    if not data:
+        return JSONResponse({"error": "No thumbnail"}, status_code=404)
+    return Response(
+        data,
+        media_type="image/jpeg",
+        headers={"Cache-Control": "private, max-age=31536000, immutable"},
+    )
+
+
 # --- API ROUTES ---
 
 @app.post("/api/checkPassword")
@@ -82,6 +228,87 @@ async def api_new_folder(request: Request):
     return JSONResponse({"status": "ok"})
 
 
+def list_folder(folder_data, data):
+    """
+    Converts a folder for the getDirectory response, one page of it when the
+    request has a "limit", ordered by "sort" (name/size/date) and "order"
+    """
+    from utils.directoryHandler import DRIVE_DATA
+
+    if not data.get("limit"):
+        return convert_class_to_dict(folder_data, isObject=True, showtrash=False), {}
+
+    sort = data.get("sort", "name")
+    order = data.get("order", "asc")
+    if sort not in SORT_KEYS or order not in ("asc", "desc"):
+        raise ValueError("Invalid sort or order")
+    limit = int(data["limit"])
+    if limit < 1:
+        raise ValueError("Invalid limit")
+
+    contents, next_cursor, total = DRIVE_DATA.list_directory(
+        folder_data, sort, order, min(limit, 1000), data.get("cursor")
+    )
+    page = convert_class_to_dict(
+        {"contents": contents}, isObject=False, showtrash=False
+    )
+    return page, {"next_cursor": next_cursor, "total": total}
+
+
+def cached_listing(folder_data, data, auth_home_path):
+    """
+    Serves a folder listing from the encoded response cache. Clients that send
+    back the "version" of the first page they already hold get an "unchanged"
+    reply instead. The version covers the sort and page size it was issued
+    for, and later pages are always served.
+    """
+    version = ":".join(
+        str(part)
+        for part in (
+            folder_data.version,
+            data.get("limit"),
+            data.get("sort"),
+            data.get("order"),
+        )
+    )
+    if not data.get("cursor") and data.get("version") == version:
+        return JSONResponse({"status": "unchanged", "version": version})
+
+    key = (folder_data.id, version, auth_home_path, data.get("cursor"))
+    entry = LISTING_CACHE.get(key)
+    if entry is None:
+        try:
+            listing, page_info = list_folder(folder_data, data)
+        except ValueError as e:
+            return JSONResponse({"status": str(e)}, status_code=400)
+        body = dumps(
+            {
+                "status": "ok",
+                "data": listing,
+                "auth_home_path": auth_home_path,
+                "version": version,
+                **page_info,
+            }
+        )
+        file_ids = [
+            id for id in listing["contents"] if folder_data.contents[id].type == "file"
+        ]
+        entry = (body, file_ids)
+        LISTING_CACHE.put(key, *entry)
+
+    # Resolve the shown files ahead of the streams the user is about to open,
+    # on cache hits too as affinity and cached FileIds expire, once per interval
+    body, file_ids = entry
+    if file_ids and should_warm((folder_data.id, data.get("cursor"))):
+        files = [
+            folder_data.contents[id]
+            for id in file_ids[:WARM_BATCH_SIZE]
+            if id in folder_data.contents
+        ]
+        asyncio.create_task(warm_listing(files))
+    return Response(body, media_type="application/json")
+
+
 @app.post("/api/getDirectory")
 async def api_get_directory(request: Request):
     from utils.directoryHandler import DRIVE_DATA
@@ -105,17 +332,15 @@ async def api_get_directory(request: Request):
         path = data["path"].split("_", 1)[1]
         folder_data, auth_home_path = DRIVE_DATA.get_directory(path, is_admin, auth)
         auth_home_path = auth_home_path.replace("//", "/") if auth_home_path else None
-        folder_data = convert_class_to_dict(folder_data, isObject=True, showtrash=False)
-        return JSONResponse({"status": "ok", "data": folder_data, "auth_home_path": auth_home_path})
+        return cached_listing(folder_data, data, auth_home_path)
     else:
         folder_data = DRIVE_DATA.get_directory(data["path"])
-        folder_data = convert_class_to_dict(folder_data, isObject=True, showtrash=False)
-        
+        return cached_listing(folder_data, data, None)
+
     return JSONResponse({"status": "ok", "data": folder_data, "auth_home_path": None})
 
 
 # --- UPLOAD HANDLERS ---
-SAVE_PROGRESS = {}
 
 @app.post("/api/upload")
 async def upload_file(
@@ -125,78 +350,183 @@ async def upload_file(
     id: str = Form(...),
     total_size: str = Form(...),
 ):
-    global SAVE_PROGRESS
-
     if password != ADMIN_PASSWORD:
         return JSONResponse({"status": "Invalid password"})
 
     total_size = int(total_size)
-    SAVE_PROGRESS[id] = ("running", 0, total_size)
+    JOBS.update(id, "save", "running", 0, total_size)
 
     ext = file.filename.lower().split(".")[-1] if "." in file.filename else "bin"
     cache_dir = Path("./cache")
     cache_dir.mkdir(parents=True, exist_ok=True)
     file_location = cache_dir / f"{id}.{ext}"
     file_size = 0
+    hasher = hashlib.sha256()
 
     try:
         async with aiofiles.open(file_location, "wb") as buffer:
             while chunk := await file.read(1024 * 1024):
-                SAVE_PROGRESS[id] = ("running", file_size, total_size)
+                JOBS.update(id, "save", "running", file_size, total_size)
                 file_size += len(chunk)
                 if file_size > MAX_FILE_SIZE:
                     await buffer.close()
                     file_location.unlink()
                     raise HTTPException(status_code=400, detail=f"File size exceeds limit")
+                hasher.update(chunk)
                 await buffer.write(chunk)
     except Exception as e:
         logger.error(f"Upload failed: {e}")
+        JOBS.update(id, "save", "error", file_size, total_size)
         return JSONResponse({"status": "error", "message": str(e)})
 
-    SAVE_PROGRESS[id] = ("completed", file_size, file_size)
+    JOBS.update(id, "save", "completed", file_size, file_size)
 
     asyncio.create_task(
-        start_file_uploader(file_location, id, path, file.filename, file_size)
+        start_file_uploader(
+            file_location,
+            id,
+            path,
+            file.filename,
+            file_size,
+            file_hash=f"sha256:{hasher.hexdigest()}",
+        )
     )
     return JSONResponse({"id": id, "status": "ok"})
 
 
+# --- RESUMABLE UPLOAD HANDLERS ---
+
+@app.post("/api/upload/create")
+async def create_resumable_upload(request: Request):
+    data = await request.json()
+    if data.get("password") != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+
+    total_size = int(data["total_size"])
+    if total_size > MAX_FILE_SIZE:
+        return JSONResponse({"status": "error", "message": "File size exceeds limit"})
+    if total_size <= 0:
+        # Telegram doesn't take empty documents
+        return JSONResponse({"status": "error", "message": "File is empty"})
+
+    id = data.get("id") or getRandomID()
+    session = create_upload_session(id, data["path"], data["filename"], total_size)
+    JOBS.update(id, "save", "running", session.received, total_size)
+    return JSONResponse({"status": "ok", "data": session.state()})
+
+
+@app.post("/api/upload/chunk")
+async def upload_chunk(
+    file: UploadFile = File(...),
+    password: str = Form(...),
+    id: str = Form(...),
+    offset: str = Form(...),
+):
+    if password != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+
+    session = UPLOAD_SESSIONS.get(id)
+    if session is None:
+        return JSONResponse({"status": "not found"})
+
+    try:
+        await session.write_chunk(int(offset), file)
+    except Exception as e:
+        logger.error(f"Chunk upload failed: {e}")
+        return JSONResponse({"status": "error", "message": str(e)})
+
+    JOBS.update(id, "save", "running", session.received, session.total_size)
+    return JSONResponse({"status": "ok", "data": session.state()})
+
+
+@app.post("/api/upload/status")
+async def resumable_upload_status(request: Request):
+    data = await request.json()
+    if data.get("password") != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+
+    session = UPLOAD_SESSIONS.get(data["id"])
+    if session is None:
+        return JSONResponse({"status": "not found"})
+    return JSONResponse({"status": "ok", "data": session.state()})
+
+
+@app.post("/api/upload/finalize")
+async def finalize_resumable_upload(request: Request):
+    data = await request.json()
+    if data.get("password") != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+
+    session = UPLOAD_SESSIONS.get(data["id"])
+    if session is None:
+        return JSONResponse({"status": "not found"})
+    if not session.is_complete:
+        return JSONResponse({"status": "incomplete", "data": session.state()})
+
+    session.finalize()
+    JOBS.update(
+        session.id, "save", "completed", session.total_size, session.total_size
+    )
+
+    # Chunks arrive out of order, so the content hash is taken once complete
+    file_hash = await asyncio.to_thread(hash_file, session.file_location)
+    asyncio.create_task(
+        start_file_uploader(
+            session.file_location,
+            session.id,
+            session.path,
+            session.filename,
+            session.total_size,
+            file_hash=file_hash,
+        )
+    )
+    return JSONResponse({"id": session.id, "status": "ok"})
+
+
 @app.post("/api/getSaveProgress")
 async def get_save_progress(request: Request):
-    global SAVE_PROGRESS
     data = await request.json()
     if data.get("password") != ADMIN_PASSWORD:
         return JSONResponse({"status": "Invalid password"})
-    try:
-        progress = SAVE_PROGRESS[data["id"]]
-        return JSONResponse({"status": "ok", "data": progress})
-    except:
+    progress = JOBS.get(data["id"], "save")
+    if progress is None:
         return JSONResponse({"status": "not found"})
+    return JSONResponse({"status": "ok", "data": progress})
 
 
 @app.post("/api/getUploadProgress")
 async def get_upload_progress(request: Request):
-    from utils.uploader import PROGRESS_CACHE
     data = await request.json()
     if data.get("password") != ADMIN_PASSWORD:
         return JSONResponse({"status": "Invalid password"})
-    try:
-        progress = PROGRESS_CACHE[data["id"]]
-        return JSONResponse({"status": "ok", "data": progress})
-    except:
+    progress = JOBS.get(data["id"], "upload")
+    if progress is None:
         return JSONResponse({"status": "not found"})
+    return JSONResponse({"status": "ok", "data": progress})
+
+
+@app.get("/api/progressEvents")
+async def progress_events(request: Request):
+    """Pushes save/download/upload progress of a job as Server-Sent Events"""
+    if request.query_params.get("password") != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+    return StreamingResponse(
+        JOBS.stream_events(request.query_params["id"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.post("/api/cancelUpload")
 async def cancel_upload(request: Request):
-    from utils.uploader import STOP_TRANSMISSION
-    from utils.downloader import STOP_DOWNLOAD
     data = await request.json()
     if data.get("password") != ADMIN_PASSWORD:
         return JSONResponse({"status": "Invalid password"})
     logger.info(f"cancelUpload {data}")
-    STOP_TRANSMISSION.append(data["id"])
-    STOP_DOWNLOAD.append(data["id"])
+    session = UPLOAD_SESSIONS.pop(data["id"], None)
+    if session is not None and not session.finalized:
+        session.discard()
+    JOBS.cancel(data["id"])
     return JSONResponse({"status": "ok"})
 
 
@@ -232,6 +562,118 @@ async def delete_file_folder(request: Request):
     return JSONResponse({"status": "ok"})
 
 
+@app.post("/api/moveFileFolder")
+async def move_file_folder(request: Request):
+    from utils.directoryHandler import DRIVE_DATA
+    data = await request.json()
+    if data.get("password") != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+    try:
+        DRIVE_DATA.move_file_folder(data["path"], data["destination"])
+    except Exception as e:
+        return JSONResponse({"status": str(e)})
+    return JSONResponse({"status": "ok"})
+
+
+@app.post("/api/batchOperations")
+async def batch_operations(request: Request):
+    """Applies a list of rename/trash/restore/delete/move operations atomically"""
+    from utils.directoryHandler import DRIVE_DATA
+    data = await request.json()
+    if data.get("password") != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+    logger.info(f"batchOperations {len(data['operations'])} operations")
+    try:
+        DRIVE_DATA.apply_operations(data["operations"])
+    except Exception as e:
+        logger.error(f"Batch operations failed: {e!r}")
+        return JSONResponse({"status": f"Operation failed, nothing was changed: {e!r}"})
+    return JSONResponse({"status": "ok"})
+
+
+@app.post("/api/getChanges")
+async def get_changes(request: Request):
+    """
+    Delta sync feed, returns the changes made after the "since" sequence. When
+    "reset" is true the client is too far behind and must re-fetch the drive.
+    """
+    from utils.directoryHandler import DRIVE_DATA
+    data = await request.json()
+    if data.get("password") != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+
+    since = int(data.get("since", 0))
+    limit = min(int(data.get("limit", 1000)), 1000)
+    changes, next_seq, reset = DRIVE_DATA.get_changes(since, limit)
+    return JSONResponse(
+        {
+            "status": "ok",
+            "changes": changes,
+            "next_seq": next_seq,
+            "latest_seq": DRIVE_DATA.change_seq,
+            "reset": reset,
+        }
+    )
+
+
+@app.post("/api/getStreamStats")
+async def get_stream_stats_route(request: Request):
+    """Client affinity hit rate and active streams per client"""
+    data = await request.json()
+    if data.get("password") != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+    return JSONResponse({"status": "ok", "data": get_stream_stats()})
+
+
+@app.post("/api/getZipContents")
+async def get_zip_contents(request: Request):
+    """Lists the members of a ZIP archive on the drive from its central directory"""
+    from utils.directoryHandler import DRIVE_DATA
+    data = await request.json()
+    try:
+        file = DRIVE_DATA.get_file(data["path"])
+        if not is_authorized(data.get("password"), data.get("auth"), file.id):
+            return JSONResponse({"status": "Invalid password"})
+        members = await list_zip_members(file)
+    except Exception as e:
+        logger.error(f"Failed to read ZIP contents of {data.get('path')}: {e!r}")
+        return JSONResponse({"status": f"Failed to read archive: {e}"})
+    return JSONResponse({"status": "ok", "data": members})
+
+
+@app.post("/api/getThumbnails")
+async def get_thumbnails_batch(request: Request):
+    """
+    Thumbnails of a page of files as data URIs, null for files without one,
+    so a grid view can fill in its previews with a single request
+    """
+    from utils.directoryHandler import DRIVE_DATA
+    data = await request.json()
+
+    password, auth = data.get("password"), data.get("auth")
+    if password != ADMIN_PASSWORD and not auth:
+        return JSONResponse({"status": "Invalid password"})
+
+    files = {}
+    for path in data["paths"][:200]:
+        try:
+            file = DRIVE_DATA.get_file(path)
+        except Exception:
+            continue
+        # Share visitors only get the thumbnails of files in their shared folder
+        if is_authorized(password, auth, file.id):
+            files[path] = file
+
+    thumbs = await get_thumbnails(files)
+    result = {
+        path: f"data:image/jpeg;base64,{base64.b64encode(thumb).decode()}"
+        if thumb
+        else None
+        for path, thumb in thumbs.items()
+    }
+    return JSONResponse({"status": "ok", "data": result})
+
+
 # --- REMOTE URL DOWNLOAD ROUTES ---
 
 @app.post("/api/getFileInfoFromUrl")
@@ -282,17 +724,53 @@ async def startFileDownloadFromUrl(request: Request):
         return JSONResponse({"status": str(e)})
 
 
+@app.post("/api/startBatchDownloadFromUrls")
+async def startBatchDownloadFromUrls(request: Request):
+    data = await request.json()
+
+    if data.get("password") != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+
+    items = data.get("items") or []
+    if not items or any(not item.get("url") or not item.get("path") for item in items):
+        return JSONResponse({"status": "Every item needs a url and a path"})
+
+    batch_id = getRandomID()
+    for item in items:
+        item["id"] = getRandomID()
+        if not item.get("filename") or item["filename"].strip() == "":
+            item["filename"] = None
+
+    logger.info(f"startBatchDownloadFromUrls {batch_id} with {len(items)} URLs")
+    JOBS.add_members(batch_id, [item["id"] for item in items])
+    asyncio.create_task(
+        download_files(batch_id, items, data.get("singleThreaded", False))
+    )
+    return JSONResponse(
+        {"status": "ok", "id": batch_id, "ids": [item["id"] for item in items]}
+    )
+
+
+@app.post("/api/getBatchDownloadProgress")
+async def getBatchDownloadProgress(request: Request):
+    data = await request.json()
+    if data.get("password") != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+    progress = JOBS.batch_progress(data["id"])
+    if progress is None:
+        return JSONResponse({"status": "not found"})
+    return JSONResponse({"status": "ok", "data": progress})
+
+
 @app.post("/api/getFileDownloadProgress")
 async def getFileDownloadProgress(request: Request):
-    from utils.downloader import DOWNLOAD_PROGRESS
     data = await request.json()
     if data.get("password") != ADMIN_PASSWORD:
         return JSONResponse({"status": "Invalid password"})
-    try:
-        progress = DOWNLOAD_PROGRESS[data["id"]]
-        return JSONResponse({"status": "ok", "data": progress})
-    except:
+    progress = JOBS.get(data["id"], "download")
+    if progress is None:
         return JSONResponse({"status": "not found"})
+    return JSONResponse({"status": "ok", "data": progress})
 
 
 @app.post("/api/getFolderShareAuth")
@@ -306,3 +784,16 @@ async def getFolderShareAuth(request: Request):
         return JSONResponse({"status": "ok", "auth": auth})
     except:
         return JSONResponse({"status": "not found"})
+
+
+@app.post("/api/revokeFolderShareAuth")
+async def revokeFolderShareAuth(request: Request):
+    from utils.directoryHandler import DRIVE_DATA
+    data = await request.json()
+    if data.get("password") != ADMIN_PASSWORD:
+        return JSONResponse({"status": "Invalid password"})
+    try:
+        DRIVE_DATA.revoke_folder_auth(data["auth"])
+        return JSONResponse({"status": "ok"})
+    except KeyError:
+        return JSONResponse({"status": "not found"}, status_code=404)
@@ -0,0 +1,9 @@
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# config.py requires these, no test connects to Telegram
+os.environ.setdefault("API_ID", "1")
+os.environ.setdefault("API_HASH", "test")
+os.environ.setdefault("BOT_TOKENS", "1:test")
+os.environ.setdefault("STORAGE_CHANNEL", "-1001")
@@ -0,0 +1,56 @@
+import asyncio
+from fastapi.responses import StreamingResponse
+from types import SimpleNamespace
+from utils.admission import StreamAdmission
+
+
+def make_request(ip="10.0.0.1"):
+    return SimpleNamespace(headers={}, client=SimpleNamespace(host=ip), query_params={})
+
+
+def test_caps_per_client_and_per_share():
+    admission = StreamAdmission(max_total=10, max_per_client=2, max_per_share=3, bandwidth=0)
+
+    assert admission.try_acquire("a", "share")
+    assert admission.try_acquire("a", "share")
+    assert not admission.try_acquire("a", "share")
+    assert admission.try_acquire("b", "share")
+    assert not admission.try_acquire("c", "share")
+    assert admission.try_acquire("c")
+
+    assert admission.clients == {"a": 2, "b": 1, "c": 1}
+    assert admission.shares == {"share": 3}
+    assert admission.rejected == 2
+
+
+def test_rejections_leave_no_counters_behind():
+    admission = StreamAdmission(max_total=1, max_per_client=1, max_per_share=1, bandwidth=0)
+    assert admission.try_acquire("a", "share")
+    for index in range(100):
+        assert not admission.try_acquire(f"ip{index}", f"share{index}")
+
+    admission.release("a", "share")
+    assert admission.clients == {}
+    assert admission.shares == {}
+    assert admission.total == 0
+
+
+def test_slot_is_held_until_the_body_ends():
+    admission = StreamAdmission(max_total=1, max_per_client=0, max_per_share=0, bandwidth=0)
+
+    async def body():
+        yield b"chunk"
+
+    async def scenario():
+        response = await admission.admit(
+            make_request(), lambda: asyncio.sleep(0, StreamingResponse(body()))
+        )
+        rejected = await admission.admit(
+            make_request("10.0.0.2"), lambda: asyncio.sleep(0, StreamingResponse(body()))
+        )
+        assert rejected.status_code == 503
+
+        assert [chunk async for chunk in response.body_iterator] == [b"chunk"]
+        assert admission.total == 0
+
+    asyncio.run(scenario())
@@ -0,0 +1,34 @@
+import pytest
+from utils import directoryHandler
+from utils.directoryHandler import Folder, NewDriveData
+
+
+@pytest.fixture
+def drive(monkeypatch, tmp_path):
+    monkeypatch.setattr(directoryHandler, "drive_cache_path", tmp_path / "drive.data")
+    monkeypatch.setattr(directoryHandler, "CHANGE_LOG_SIZE", 3)
+    monkeypatch.setattr(directoryHandler, "DRIVE_DATA", None)
+    drive = NewDriveData({"/": Folder("/", "/")}, [])
+    monkeypatch.setattr(directoryHandler, "DRIVE_DATA", drive)
+    return drive
+
+
+def test_failed_batch_restores_full_change_feed(drive):
+    paths = [drive.new_folder("/", name) for name in ("a", "b", "c")]
+    feed = list(drive.change_log)
+    seq = drive.change_seq
+    assert len(feed) == 3
+
+    with pytest.raises(Exception):
+        drive.apply_operations(
+            [
+                {"op": "rename", "path": paths[0], "name": "renamed a"},
+                {"op": "rename", "path": paths[1], "name": "renamed b"},
+                {"op": "rename", "path": paths[2], "name": ""},
+            ]
+        )
+
+    assert list(drive.change_log) == feed
+    assert drive.change_seq == seq
+    names = sorted(item.name for item in drive.contents["/"].contents.values())
+    assert names == ["a", "b", "c"]
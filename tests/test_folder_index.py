@@ -0,0 +1,72 @@
+import pytest
+from types import SimpleNamespace
+from utils.folder_index import FolderIndex, SORT_KEYS, sort_value
+
+
+def make_folder():
+    contents = {}
+    for index in range(7):
+        id = f"d{index}"
+        contents[id] = SimpleNamespace(
+            id=id, name=f"Dir {index % 3}", type="folder", trash=False,
+            size=index, upload_date=f"2024-01-0{index % 4 + 1} 00:00:00",
+        )
+    for index in range(11):
+        id = f"f{index}"
+        contents[id] = SimpleNamespace(
+            id=id, name=f"file {index % 4}", type="file", trash=index == 5,
+            size=index * 10 % 7, upload_date=f"2024-02-0{index % 5 + 1} 00:00:00",
+        )
+    return SimpleNamespace(contents=contents)
+
+
+def expected_order(folder, sort, order):
+    items = [item for item in folder.contents.values() if not item.trash]
+    keyed = sorted(
+        items,
+        key=lambda item: (sort_value(item, sort), item.id),
+        reverse=order == "desc",
+    )
+    return [i.id for i in keyed if i.type == "folder"] + [
+        i.id for i in keyed if i.type == "file"
+    ]
+
+
+@pytest.mark.parametrize("sort", SORT_KEYS)
+@pytest.mark.parametrize("order", ("asc", "desc"))
+@pytest.mark.parametrize("limit", (1, 4, 100))
+def test_cursor_pages_cover_every_item_once_in_order(sort, order, limit):
+    folder = make_folder()
+    index = FolderIndex(folder)
+
+    ids, cursor = [], None
+    while True:
+        page, cursor = index.page(sort, order, limit, cursor)
+        assert len(page) <= limit
+        ids += page
+        if cursor is None:
+            break
+
+    assert ids == expected_order(folder, sort, order)
+
+
+def test_pages_stay_consistent_across_mutations():
+    folder = make_folder()
+    index = FolderIndex(folder)
+    first, cursor = index.page("name", "asc", 5)
+
+    # Removing an item already listed doesn't shift the next page
+    index.remove(first[0])
+    second, _ = index.page("name", "asc", 5, cursor)
+    assert not set(first) & set(second)
+    assert second == expected_order(folder, "name", "asc")[5:10]
+
+
+def test_cursor_of_another_sort_is_rejected():
+    index = FolderIndex(make_folder())
+    _, cursor = index.page("name", "asc", 2)
+
+    with pytest.raises(ValueError):
+        index.page("size", "asc", 2, cursor)
+    with pytest.raises(ValueError):
+        index.page("name", "asc", 2, "not a cursor")
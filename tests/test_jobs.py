@@ -0,0 +1,51 @@
+import asyncio, time
+from utils.jobs import JobRegistry
+
+
+def test_large_batch_keeps_its_entry_and_queued_members():
+    jobs = JobRegistry(ttl=60, max_jobs=10)
+    members = [f"m{index}" for index in range(50)]
+    jobs.add_members("batch", members)
+
+    assert "batch" in jobs.jobs
+    assert all(member in jobs.jobs for member in members)
+    assert jobs.batch_progress("batch")["queued"] == 50
+
+
+def test_queued_members_outlive_the_ttl():
+    jobs = JobRegistry(ttl=60, max_jobs=10)
+    jobs.add_members("batch", ["m0", "m1"])
+    for job in jobs.jobs.values():
+        job.updated = time.time() - 120
+
+    jobs.update("other", "upload", "completed", 1, 1)
+    assert jobs.jobs["m1"].batch_id == "batch"
+
+
+def test_finished_jobs_are_evicted_past_the_cap():
+    jobs = JobRegistry(ttl=60, max_jobs=3)
+    jobs.update("running", "download", "Downloading", 1, 10)
+    for index in range(5):
+        jobs.update(f"done{index}", "upload", "completed", 1, 1)
+
+    assert "running" in jobs.jobs
+    assert len(jobs.jobs) == 3
+    assert list(jobs.jobs) == ["running", "done3", "done4"]
+
+
+def test_waited_on_job_is_not_evicted_and_sees_its_cancel():
+    async def scenario():
+        jobs = JobRegistry(ttl=60, max_jobs=1)
+        waiter = asyncio.create_task(jobs.wait_cancelled("job"))
+        await asyncio.sleep(0)
+
+        jobs.update("job", "upload", "completed", 1, 1)
+        jobs.update("other", "upload", "completed", 1, 1)
+        await asyncio.sleep(0)
+        assert "job" in jobs.jobs
+        assert not waiter.done()
+
+        jobs.cancel("job")
+        await asyncio.wait_for(waiter, 1)
+
+    asyncio.run(scenario())
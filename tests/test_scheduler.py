@@ -0,0 +1,67 @@
+import asyncio
+from pyrogram.errors import FloodWait
+from utils.scheduler import PRIORITY_STATUS, PRIORITY_STREAM, CallScheduler
+
+
+def test_stream_read_goes_before_status_edits_of_another_class():
+    # The read has to wait for its own class bucket, edits only for the
+    # client-wide one, which must still save its token for the read
+    scheduler = CallScheduler({"read": (5, 1), "edit": (50, 50)}, (10, 1))
+    order = []
+
+    def record(tag):
+        async def call(client):
+            order.append(tag)
+
+        return call
+
+    async def scenario():
+        await scheduler.call("read", record("first"), "client")  # spends both buckets
+        await asyncio.gather(
+            *(
+                scheduler.call("edit", record(f"edit{index}"), "client", priority=PRIORITY_STATUS)
+                for index in range(2)
+            ),
+            scheduler.call("read", record("read"), "client", priority=PRIORITY_STREAM),
+        )
+
+    asyncio.run(scenario())
+    assert order == ["first", "read", "edit0", "edit1"]
+
+
+def test_cancelled_waiter_doesnt_block_the_queue():
+    scheduler = CallScheduler({"read": (20, 1)}, (20, 1))
+
+    async def noop(client):
+        pass
+
+    async def scenario():
+        await scheduler.call("read", noop, "client")
+        waiter = asyncio.create_task(scheduler.call("read", noop, "client"))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.wait_for(scheduler.call("read", noop, "client"), 1)
+
+    asyncio.run(scenario())
+
+
+def test_only_reads_are_rerouted_after_a_flood_wait():
+    scheduler = CallScheduler({"read": (50, 50), "send": (50, 50)}, (50, 50))
+    calls = []
+
+    async def flooded_on_a(client):
+        calls.append(client)
+        if client == "a":
+            raise FloodWait(value=30)
+
+    async def scenario():
+        await scheduler.call("read", flooded_on_a, "a", pool=["a", "b"])
+        assert calls == ["a", "b"]
+
+        calls.clear()
+        send = asyncio.create_task(scheduler.call("send", flooded_on_a, "a", pool=["a", "b"]))
+        await asyncio.sleep(0.1)
+        assert calls == ["a"]  # waits out the FloodWait on "a"
+        send.cancel()
+
+    asyncio.run(scenario())
@@ -0,0 +1,101 @@
+import asyncio, io, os, zipfile
+import pytest
+from collections import OrderedDict
+from types import SimpleNamespace
+from utils.streamer import zip_stream
+from utils.streamer.zip_stream import ZipLayout, collect_entries, yield_zip
+
+DATA = {
+    1: b"hello world " * 5000,
+    2: os.urandom(70000),
+    3: b"",
+    4: b"trashed",
+}
+
+
+def make_file(file_id, name, trash=False):
+    return SimpleNamespace(
+        id=f"f{file_id}", name=name, type="file", trash=trash, size=len(DATA[file_id]),
+        upload_date="2024-05-06 07:08:09", channel=-1001, file_id=file_id, parts=None,
+    )
+
+
+def make_folder():
+    sub = SimpleNamespace(
+        id="sub", name="sub", type="folder", trash=False,
+        upload_date="2024-05-06 07:08:09", contents={"f2": make_file(2, "random.bin")},
+    )
+    return SimpleNamespace(
+        id="root", name="/", contents={
+            "f1": make_file(1, "hello.txt"),
+            "sub": sub,
+            "f3": make_file(3, "empty.txt"),
+            "f4": make_file(4, "gone.txt", trash=True),
+        },
+    )
+
+
+async def fake_file_bytes(tg_connect, entry, from_bytes, until_bytes):
+    data = DATA[entry.file.file_id][from_bytes : until_bytes + 1]
+    for offset in range(0, len(data), 3000):
+        yield data[offset : offset + 3000]
+
+
+@pytest.fixture(autouse=True)
+def fake_telegram(monkeypatch):
+    monkeypatch.setattr(zip_stream, "CRC_CACHE", OrderedDict())
+    monkeypatch.setattr(zip_stream, "file_bytes", fake_file_bytes)
+
+
+def read_range(from_bytes, until_bytes):
+    layout = ZipLayout(collect_entries(make_folder()))
+
+    async def collect():
+        return b"".join(
+            [chunk async for chunk in yield_zip(None, layout, from_bytes, until_bytes)]
+        )
+
+    return layout, asyncio.run(collect())
+
+
+def test_whole_archive_is_a_valid_zip():
+    layout = ZipLayout(collect_entries(make_folder()))
+    _, archive = read_range(0, layout.total_size - 1)
+
+    assert len(archive) == layout.total_size
+    with zipfile.ZipFile(io.BytesIO(archive)) as zf:
+        assert zf.testzip() is None  # every CRC matches
+        assert sorted(zf.namelist()) == ["empty.txt", "hello.txt", "sub/", "sub/random.bin"]
+        assert zf.read("hello.txt") == DATA[1]
+        assert zf.read("sub/random.bin") == DATA[2]
+
+
+def test_ranges_match_the_whole_archive_once_crcs_are_known():
+    layout = ZipLayout(collect_entries(make_folder()))
+    _, archive = read_range(0, layout.total_size - 1)
+
+    boundaries = [offset for offset, _, _, _ in layout.segments]
+    for from_bytes, until_bytes in [
+        (0, 0),
+        (1, 100),
+        (boundaries[2] - 5, boundaries[2] + 5),
+        (len(DATA[1]) // 2, layout.total_size - 1),
+        (layout.central_offset, layout.total_size - 1),
+        (layout.total_size - 22, layout.total_size - 1),
+    ]:
+        _, part = read_range(from_bytes, until_bytes)
+        assert part == archive[from_bytes : until_bytes + 1]
+
+
+def test_ranged_request_without_crcs_gets_the_whole_archive(monkeypatch):
+    lease = SimpleNamespace(release=lambda: None)
+    monkeypatch.setattr(zip_stream, "get_stream_client", lambda key: (None, lease))
+    monkeypatch.setattr(zip_stream, "get_streamer", lambda client: None)
+    request = SimpleNamespace(headers={"Range": "bytes=100-"})
+
+    response = asyncio.run(zip_stream.zip_streamer(make_folder(), request))
+    total_size = ZipLayout(collect_entries(make_folder())).total_size
+
+    assert response.status_code == 200
+    assert response.headers["Accept-Ranges"] == "none"
+    assert response.headers["Content-Length"] == str(total_size)
@@ -0,0 +1,177 @@
+import asyncio, time
+from collections import OrderedDict
+from fastapi.responses import JSONResponse, StreamingResponse
+from config import (
+    CLIENT_IP_HEADER,
+    STREAM_CLIENT_BANDWIDTH,
+    STREAM_MAX_CONCURRENT,
+    STREAM_MAX_PER_CLIENT,
+    STREAM_MAX_PER_SHARE,
+)
+from utils.logger import Logger
+
+logger = Logger(__name__)
+
+# Seconds a rejected client is told to wait before retrying
+RETRY_AFTER = 5
+
+# Token buckets kept for recently seen client IPs
+MAX_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Shapes a byte stream to `rate` bytes per second with a one second burst"""
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    async def consume(self, amount: int) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        # Going into debt keeps chunks whole, the sleep pays it back
+        self.tokens -= amount
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+def get_client_ip(request) -> str:
+    """The client IP, the last address of CLIENT_IP_HEADER when set"""
+    if CLIENT_IP_HEADER:
+        forwarded = request.headers.get(CLIENT_IP_HEADER, "")
+        addresses = [address.strip() for address in forwarded.split(",")]
+        if addresses[-1]:
+            return addresses[-1]
+    return request.client.host if request.client else "unknown"
+
+
+class AdmittedBody:
+    """Shapes the body of an admitted stream and gives its slot back once it ends"""
+
+    def __init__(self, admission, body, client: str, share: str) -> None:
+        self.admission = admission
+        self.body = body
+        self.client = client
+        self.share = share
+        self.bucket = admission.get_bucket(client)
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.admission.release(self.client, self.share)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            chunk = await self.body.__anext__()
+            if self.bucket is not None:
+                await self.bucket.consume(len(chunk))
+            return chunk
+        except BaseException:
+            self.release()
+            raise
+
+    async def aclose(self) -> None:
+        self.release()
+        if hasattr(self.body, "aclose"):
+            await self.body.aclose()
+
+    def __del__(self) -> None:
+        self.release()
+
+
+class StreamAdmission:
+    """Caps concurrent streams globally, per client IP and per shared folder"""
+
+    def __init__(
+        self, max_total: int, max_per_client: int, max_per_share: int, bandwidth: float
+    ) -> None:
+        self.max_total = max_total
+        self.max_per_client = max_per_client
+        self.max_per_share = max_per_share
+        self.bandwidth = bandwidth
+        self.total = 0
+        self.clients = {}
+        self.shares = {}
+        self.buckets = OrderedDict()
+        self.rejected = 0
+
+    def try_acquire(self, client: str, share: str = None) -> bool:
+        if (
+            (self.max_total and self.total >= self.max_total)
+            or (self.max_per_client and self.clients.get(client, 0) >= self.max_per_client)
+            or (
+                share
+                and self.max_per_share
+                and self.shares.get(share, 0) >= self.max_per_share
+            )
+        ):
+            self.rejected += 1
+            return False
+
+        self.total += 1
+        self.clients[client] = self.clients.get(client, 0) + 1
+        if share:
+            self.shares[share] = self.shares.get(share, 0) + 1
+        return True
+
+    def release(self, client: str, share: str = None) -> None:
+        self.total -= 1
+        self.clients[client] -= 1
+        if not self.clients[client]:
+            del self.clients[client]
+        if share:
+            self.shares[share] -= 1
+            if not self.shares[share]:
+                del self.shares[share]
+
+    def get_bucket(self, client: str):
+        if not self.bandwidth:
+            return None
+        bucket = self.buckets.get(client)
+        if bucket is None:
+            bucket = TokenBucket(self.bandwidth)
+            self.buckets[client] = bucket
+            while len(self.buckets) > MAX_BUCKETS:
+                self.buckets.popitem(last=False)
+        self.buckets.move_to_end(client)
+        return bucket
+
+    async def admit(self, request, start_stream, share: str = None):
+        """Runs `start_stream()` within the caps, else returns a 503"""
+        client = get_client_ip(request)
+
+        if not self.try_acquire(client, share):
+            logger.warning(f"Rejected stream for {client}, too many active streams")
+            return JSONResponse(
+                {"error": "Too many active downloads, retry later"},
+                status_code=503,
+                headers={"Retry-After": str(RETRY_AFTER)},
+            )
+
+        try:
+            response = await start_stream()
+        except BaseException:
+            self.release(client, share)
+            raise
+
+        if not isinstance(response, StreamingResponse):
+            self.release(client, share)
+            return response
+
+        response.body_iterator = AdmittedBody(self, response.body_iterator, client, share)
+        return response
+
+
+STREAM_ADMISSION = StreamAdmission(
+    STREAM_MAX_CONCURRENT,
+    STREAM_MAX_PER_CLIENT,
+    STREAM_MAX_PER_SHARE,
+    STREAM_CLIENT_BANDWIDTH * 1024 * 1024,
+)
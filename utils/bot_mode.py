@@ -5,7 +5,10 @@ import time
 from pyrogram import Client, filters
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton
 import config
+from utils.clients import get_client
 from utils.logger import Logger
+from utils.placement import STORAGE, pick_storage_channel
+from utils.scheduler import PRIORITY_STATUS, PRIORITY_UPLOAD, SCHEDULER
 from pathlib import Path
 import zipfile
 
@@ -32,6 +35,12 @@ DRIVE_DATA = None
 BOT_MODE = None
 ZIP_SESSIONS = {}
 
+# Queued files of a zip session downloaded at once, spread over the client pool
+ZIP_DOWNLOAD_CONCURRENCY = 4
+
+# Seconds between edits of a zip session's status message
+STATUS_INTERVAL = 3
+
 session_cache_path = Path(f"./cache")
 session_cache_path.parent.mkdir(parents=True, exist_ok=True)
 
@@ -44,80 +53,163 @@ main_bot = Client(
     workdir=session_cache_path,
 )
 
-async def progress_bar(current, total, status_msg, start_time, action="Downloading"):
-    """Updates progress bar for file operations"""
-    if not hasattr(progress_bar, "last_update"):
-        progress_bar.last_update = 0
-    
-    if time.time() - progress_bar.last_update < 3:
-        return
+async def edit_status(status_msg: Message, text: str):
+    """Status edits wait behind every other call of the main bot"""
+    return await SCHEDULER.call(
+        "edit", lambda _: status_msg.edit_text(text), main_bot, priority=PRIORITY_STATUS
+    )
 
-    progress_bar.last_update = time.time()
-    percentage = current * 100 / total
-    elapsed_time = round(time.time() - start_time)
-    
+def get_queued_media(msg: Message):
+    return msg.document or msg.video or msg.audio or msg.photo or msg.sticker
+
+def queued_file_name(msg: Message, media, index: int) -> str:
+    file_name = getattr(media, "file_name", None)
+    if file_name:
+        return file_name
+
+    ext = ""
+    if msg.photo:
+        ext = ".jpg"
+    elif msg.video:
+        ext = ".mp4"
+    elif msg.audio:
+        ext = ".mp3"
+    elif msg.sticker:
+        ext = ".webp"
+    return f"file_{index + 1}{ext}"
+
+class ZipProgress:
+    """Download and zip progress of a whole zip session, shown in one status message"""
+
+    def __init__(self, status_msg: Message, sizes: dict) -> None:
+        self.status_msg = status_msg
+        self.sizes = sizes  # index -> file size
+        self.received = {}  # index -> bytes downloaded so far
+        self.downloaded = 0
+        self.zipped = 0
+        self.failed = 0
+        self.start_time = time.time()
+        self.text = None
+
+    def render(self) -> str:
+        received = sum(self.received.values()) / (1024 * 1024)
+        total = sum(self.sizes.values()) / (1024 * 1024)
+        text = (
+            f"📥 **ᴅᴏᴡɴʟᴏᴀᴅɪɴɢ {len(self.sizes)} ғɪʟᴇs...**\n\n"
+            f"✅ **Dᴏᴡɴʟᴏᴀᴅᴇᴅ:** {self.downloaded}/{len(self.sizes)}\n"
+            f"🗜 **Zɪᴘᴘᴇᴅ:** {self.zipped}/{len(self.sizes)}\n"
+            f"📊 **Pʀᴏɢʀᴇss:** {received:.1f}/{total:.1f} MB\n"
+            f"⏱ **Eʟᴀᴘsᴇᴅ:** {round(time.time() - self.start_time)}s"
+        )
+        if self.failed:
+            text += f"\n❌ **Fᴀɪʟᴇᴅ:** {self.failed}"
+        return text
+
+    async def refresh(self) -> None:
+        text = self.render()
+        if text == self.text:
+            return
+        self.text = text
+        try:
+            await edit_status(self.status_msg, text)
+        except Exception as e:
+            logger.warning(f"Failed to update zip status: {e}")
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(STATUS_INTERVAL)
+            await self.refresh()
+
+async def track_download(current, total, progress: ZipProgress, index: int):
+    progress.received[index] = current
+
+async def download_queued_file(msg: Message, media, index: int, tmp_dir, progress: ZipProgress):
+    """
+    Downloads a queued file with a client of the pool. Queued messages live in
+    the admin's chat with the main bot, so files not already on the drive are
+    copied to a storage channel every client can read, and deleted afterwards.
+    """
+    directory = os.path.join(tmp_dir, str(index)) + "/"
+    duplicate = DRIVE_DATA.find_duplicate(f"tg:{media.file_unique_id}")
+    copied = False
+    client = get_client()
     try:
-        await status_msg.edit_text(
-            f"⚡ **{action} Fɪʟᴇs...**\n\n"
-            f"📊 **Pʀᴏɢʀᴇss:** {percentage:.1f}%\n"
-            f"⏱ **Eʟᴀᴘsᴇᴅ:** {elapsed_time}s"
+        if duplicate and duplicate[2] is None:
+            message_id, _, _, channel = duplicate
+        else:
+            # Temporary copy, deleted once downloaded, so placement state is left alone
+            channel = STORAGE.channels[0]
+            copy = await SCHEDULER.call(
+                "send", lambda _: msg.copy(channel), main_bot, priority=PRIORITY_UPLOAD
+            )
+            message_id, copied = copy.id, True
+
+        stored = await SCHEDULER.call(
+            "read",
+            lambda client: client.get_messages(channel, message_id),
+            client,
+            priority=PRIORITY_UPLOAD,
         )
-    except:
-        pass
+        return await client.download_media(
+            stored,
+            file_name=directory,
+            progress=track_download,
+            progress_args=(progress, index),
+        )
+    except Exception as e:
+        # A failed copy, or a pool client without access to the channel, fall
+        # back to the main bot
+        logger.warning(f"Pool download of file {index + 1} failed, using main bot: {e}")
+        progress.received[index] = 0
+        return await main_bot.download_media(
+            msg,
+            file_name=directory,
+            progress=track_download,
+            progress_args=(progress, index),
+        )
+    finally:
+        if copied:
+            try:
+                await SCHEDULER.call(
+                    "edit",
+                    lambda client: client.delete_messages(channel, message_id),
+                    client,
+                )
+            except Exception as e:
+                logger.warning(f"Failed to delete zip copy {message_id}: {e}")
 
-def create_zip_file(source_dir, output_zip):
-    """Create a zip file from all files in source_dir"""
-    if not os.path.exists(source_dir):
-        raise Exception(f"Source directory does not exist: {source_dir}")
-        
-    files_to_zip = []
-    for root, dirs, files in os.walk(source_dir):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if os.path.isfile(file_path):
-                files_to_zip.append(file_path)
-    
-    if not files_to_zip:
-        raise Exception("No files found in source directory to zip")
-    
-    logger.info(f"Creating zip with {len(files_to_zip)} files: {files_to_zip}")
-    
+async def write_zip(output_zip, completed: asyncio.Queue, progress: ZipProgress):
+    """Adds downloaded files to the archive as they arrive, while the rest still download"""
+    used_names = set()
     with zipfile.ZipFile(output_zip, 'w', zipfile.ZIP_DEFLATED) as zipf:
-        for file_path in files_to_zip:
-            arcname = os.path.basename(file_path)
-            zipf.write(file_path, arcname=arcname)
+        while (item := await completed.get()) is not None:
+            file_path, file_name = item
+            stem, dot, ext = file_name.rpartition(".")
+            if not stem:
+                stem, dot, ext = file_name, "", ""
+            arcname, count = file_name, 1
+            while arcname in used_names:
+                arcname = f"{stem} ({count}){dot}{ext}"
+                count += 1
+            used_names.add(arcname)
+
+            await asyncio.to_thread(zipf.write, file_path, arcname)
+            os.remove(file_path)
+            progress.zipped += 1
             logger.info(f"Added to zip: {arcname}")
-    
-    if not os.path.exists(output_zip):
-        raise Exception("Failed to create zip file")
-    
-    zip_size = os.path.getsize(output_zip)
-    if zip_size < 100:
-        raise Exception(f"Zip file is too small ({zip_size} bytes)")
-    
-    logger.info(f"Zip created successfully: {output_zip} ({zip_size} bytes)")
-    return output_zip
 
-async def send_drive_links(message: Message, file_name, file_size, storage_msg_id):
+async def send_drive_links(
+    message: Message, file_name, file_size, storage_msg_id, channel, unique_id=None
+):
     global DRIVE_DATA, BOT_MODE
-    DRIVE_DATA.new_file(
+    file_obj = DRIVE_DATA.new_file(
         BOT_MODE.current_folder,
         file_name,
         storage_msg_id,
         file_size,
+        unique_id=unique_id,
+        channel=channel,
     )
-    if BOT_MODE.current_folder == "/":
-        directory_folder = DRIVE_DATA.contents["/"]
-    else:
-        paths = BOT_MODE.current_folder.strip("/").split("/")
-        directory_folder = DRIVE_DATA.contents["/"]
-        for path in paths:
-            directory_folder = directory_folder.contents[path]
-    file_obj = None
-    for item_id, item in directory_folder.contents.items():
-        if hasattr(item, 'file_id') and item.file_id == storage_msg_id:
-            file_obj = item
-            break
     if not file_obj:
         logger.error("Failed to find created file object")
         await message.reply_text("❌ Error: Failed to upload file")
@@ -213,103 +305,95 @@ async def done_handler(client: Client, message: Message):
     logger.info(f"Created temp directory: {tmp_dir}")
     
     try:
-        downloaded_count = 0
-        for i, msg in enumerate(queue):
-            try:
-                start_t = time.time()
-                await status.edit_text(f"📥 **ᴅᴏᴡɴʟᴏᴀᴅɪɴɢ ғɪʟᴇ {i+1}/{len(queue)}...**")
-                
-                file = msg.document or msg.video or msg.audio or msg.photo or msg.sticker
-                if not file:
-                    logger.warning(f"Message {i+1} has no downloadable file, skipping")
-                    continue
-                
-                file_name = getattr(file, 'file_name', None)
-                if not file_name:
-                    
-                    ext = ""
-                    if msg.photo:
-                        ext = ".jpg"
-                    elif msg.video:
-                        ext = ".mp4"
-                    elif msg.audio:
-                        ext = ".mp3"
-                    elif msg.sticker:
-                        ext = ".webp"
-                    file_name = f"file_{i+1}{ext}"
-                
-                logger.info(f"Downloading file {i+1}: {file_name}")
-                
-                downloaded_path = await client.download_media(
-                    msg,
-                    file_name=tmp_dir + "/", 
-                    progress=progress_bar,
-                    progress_args=(status, start_t, "Downloading")
-                )
-                
-                if downloaded_path and os.path.exists(downloaded_path):
-                    file_size = os.path.getsize(downloaded_path)
-                    downloaded_count += 1
-                    logger.info(f"✅ Downloaded: {downloaded_path} ({file_size} bytes)")
-                    
-                    final_path = os.path.join(tmp_dir, file_name)
-                    if downloaded_path != final_path and not os.path.exists(final_path):
-                        shutil.move(downloaded_path, final_path)
-                        logger.info(f"Moved to: {final_path}")
-                else:
-                    logger.error(f"❌ Download failed for file {i+1}")
-                    
-            except Exception as e:
-                logger.error(f"Error downloading file {i+1}: {e}")
-                import traceback
-                logger.error(traceback.format_exc())
+        files = []
+        for index, msg in enumerate(list(queue)):
+            media = get_queued_media(msg)
+            if not media:
+                logger.warning(f"Message {index + 1} has no downloadable file, skipping")
                 continue
-        
+            files.append((index, msg, media, queued_file_name(msg, media, index)))
+        if not files:
+            raise Exception("No files were downloaded successfully")
+
+        progress = ZipProgress(
+            status, {index: getattr(media, "file_size", 0) for index, _, media, _ in files}
+        )
+        slots = asyncio.Semaphore(ZIP_DOWNLOAD_CONCURRENCY)
+        completed = asyncio.Queue()
+
+        async def fetch(index, msg, media, file_name):
+            async with slots:
+                try:
+                    logger.info(f"Downloading file {index + 1}: {file_name}")
+                    downloaded_path = await download_queued_file(
+                        msg, media, index, tmp_dir, progress
+                    )
+                except Exception as e:
+                    logger.error(f"Error downloading file {index + 1}: {e}")
+                    downloaded_path = None
+
+            if downloaded_path and os.path.exists(downloaded_path):
+                logger.info(f"✅ Downloaded: {downloaded_path}")
+                progress.downloaded += 1
+                await completed.put((downloaded_path, file_name))
+            else:
+                logger.error(f"❌ Download failed for file {index + 1}")
+                progress.failed += 1
+
+        async def fetch_all():
+            await asyncio.gather(*(fetch(*file) for file in files))
+            await completed.put(None)
+
+        # Files are zipped as their downloads finish
+        reporter = asyncio.create_task(progress.run())
+        downloads = asyncio.create_task(fetch_all())
+        try:
+            await write_zip(zip_path, completed, progress)
+            await downloads
+        finally:
+            reporter.cancel()
+            downloads.cancel()
+
+        downloaded_count = progress.zipped
         if downloaded_count == 0:
             raise Exception("No files were downloaded successfully")
-        
-        files_in_dir = os.listdir(tmp_dir)
-        logger.info(f"Files in temp directory ({len(files_in_dir)}): {files_in_dir}")
-        
-        if not files_in_dir:
-            raise Exception("Temp directory is empty after downloads")
-        
-        total_size = 0
-        for fname in files_in_dir:
-            fpath = os.path.join(tmp_dir, fname)
-            fsize = os.path.getsize(fpath)
-            total_size += fsize
-            logger.info(f"File: {fname} - Size: {fsize} bytes")
-        
-        logger.info(f"Total size of all files: {total_size} bytes")
-        
-        await status.edit_text(f"🗜 **Creating zip archive from {downloaded_count} files...**")
-        
-        await asyncio.to_thread(create_zip_file, tmp_dir, zip_path)
-        
+
         if not os.path.exists(zip_path):
             raise Exception("Zip file was not created")
         
         zip_size = os.path.getsize(zip_path)
         logger.info(f"✅ Final zip: {zip_path} ({zip_size} bytes)")
         
-        await status.edit_text("📤 **ᴜᴘʟᴏᴀᴅɪɴɢ ᴢɪᴘ ᴛᴏ TG Dʀɪᴠᴇ...**")
+        await edit_status(status, "📤 **ᴜᴘʟᴏᴀᴅɪɴɢ ᴢɪᴘ ᴛᴏ TG Dʀɪᴠᴇ...**")
         
         # Upload to storage channel
-        storage_msg = await client.send_document(
-            config.STORAGE_CHANNEL, 
-            zip_path,
-            caption=f"📦 Zip Archive - {downloaded_count} files ({zip_size / (1024*1024):.2f} MB)"
+        channel = pick_storage_channel(zip_size)
+        storage_msg = await SCHEDULER.call(
+            "send",
+            lambda client: client.send_document(
+                channel,
+                zip_path,
+                caption=f"📦 Zip Archive - {downloaded_count} files ({zip_size / (1024*1024):.2f} MB)"
+            ),
+            client,
+            priority=PRIORITY_UPLOAD,
         )
         
-        await send_drive_links(message, zip_name, zip_size, storage_msg.id)
+        await send_drive_links(
+            message,
+            zip_name,
+            zip_size,
+            storage_msg.id,
+            channel,
+            storage_msg.document.file_unique_id,
+        )
         await status.delete()
         
     except Exception as e:
         logger.error(f"❌ Error in zip creation: {e}")
         import traceback
         logger.error(traceback.format_exc())
-        await status.edit_text(f"❌ **Error:** {str(e)}")
+        await edit_status(status, f"❌ **Error:** {str(e)}")
     finally:
         
         if user_id in ZIP_SESSIONS:
@@ -423,7 +507,27 @@ async def file_handler(client: Client, message: Message):
     if user_id in ZIP_SESSIONS:
         ZIP_SESSIONS[user_id].append(message)
         return await message.reply_text(f"✅ **Fɪʟᴇ ᴀᴅᴅᴇᴅ ᴛᴏ ǫᴜᴇᴜᴇ!** ({len(ZIP_SESSIONS[user_id])})\n\nGɪᴠᴇ /done ᴛᴏ sᴛᴀʀᴛ ᴢɪᴘᴘɪɴɢ ᴏʀ /cancel ᴛᴏ sᴛᴏᴘ ᴢɪᴘᴘɪɴɢ")
-    copied_message = await message.copy(config.STORAGE_CHANNEL)
+    media = (
+        message.document
+        or message.video
+        or message.audio
+        or message.photo
+        or message.sticker
+    )
+    file_name = getattr(media, "file_name", None) or "file"
+    duplicate = DRIVE_DATA.find_duplicate(f"tg:{media.file_unique_id}")
+    if duplicate:
+        # Telegram already holds this exact file in the storage channel
+        storage_msg_id, file_size, _, channel = duplicate
+        logger.info(f"Duplicate of message {storage_msg_id} found, skipping copy")
+        return await send_drive_links(
+            message, file_name, file_size, storage_msg_id, channel, media.file_unique_id
+        )
+
+    channel = pick_storage_channel(getattr(media, "file_size", 0))
+    copied_message = await SCHEDULER.call(
+        "send", lambda _: message.copy(channel), main_bot, priority=PRIORITY_UPLOAD
+    )
     file = (
         copied_message.document
         or copied_message.video
@@ -431,7 +535,14 @@ async def file_handler(client: Client, message: Message):
         or copied_message.photo
         or copied_message.sticker
     )
-    await send_drive_links(message, file.file_name or "file", file.file_size, copied_message.id)
+    await send_drive_links(
+        message,
+        file_name,
+        file.file_size,
+        copied_message.id,
+        channel,
+        file.file_unique_id,
+    )
 
 async def start_bot_mode(d, b):
     global DRIVE_DATA, BOT_MODE
@@ -439,8 +550,12 @@ async def start_bot_mode(d, b):
     BOT_MODE = b
     logger.info("Starting Main Bot")
     await main_bot.start()
-    await main_bot.send_message(
-        config.STORAGE_CHANNEL, "Main Bot Started -> TG Drive's Bot Mode Enabled"
+    await SCHEDULER.call(
+        "send",
+        lambda client: client.send_message(
+            config.STORAGE_CHANNEL, "Main Bot Started -> TG Drive's Bot Mode Enabled"
+        ),
+        main_bot,
     )
     logger.info("Main Bot Started")
     logger.info("TG Drive's Bot Mode Enabled")
@@ -1,8 +1,10 @@
-import asyncio, config
+import asyncio, config, time
+from collections import OrderedDict
 from pathlib import Path
 from pyrogram import Client
 from utils.directoryHandler import backup_drive_data, loadDriveData
 from utils.logger import Logger
+from utils.scheduler import SCHEDULER
 import os
 import signal
 
@@ -14,6 +16,31 @@ work_loads = {}
 premium_work_loads = {}
 main_bot = None
 
+# Streams currently being served by each client
+stream_loads = {}
+
+# Requests for a file seen within this many seconds go to the same client
+AFFINITY_WINDOW = 5 * 60
+
+# The affine client is skipped when it serves this many streams more than the
+# least busy client
+AFFINITY_LOAD_SLACK = 4
+
+# Files remembered for affinity
+MAX_AFFINITY_ENTRIES = 10000
+
+# (channel, message_id) -> (client_id, last_used, set by listing warm-up)
+file_affinity = OrderedDict()
+stream_stats = {"affinity_hits": 0, "affinity_misses": 0, "affinity_overloaded": 0}
+stream_stats.update({"dc_warm": 0, "dc_cold": 0})
+
+# Streams that landed on a client a listing warmed them on, and files warmed
+stream_stats.update({"warmed_hits": 0, "warmed_files": 0})
+
+# Home DC of each client, learned at startup, and the DC of recently seen files
+client_dcs = {}
+file_dcs = OrderedDict()  # (channel, message_id) -> dc_id
+
 
 async def initialize_clients():
     global multi_clients, work_loads, premium_clients, premium_work_loads
@@ -41,12 +68,18 @@ async def initialize_clients():
                 )
                 client.loop = asyncio.get_running_loop()
                 await client.start()
-                await client.send_message(
-                    config.STORAGE_CHANNEL,
-                    f"Started - {type.title()} Client {client_id}",
+                await SCHEDULER.call(
+                    "send",
+                    lambda c: c.send_message(
+                        config.STORAGE_CHANNEL,
+                        f"Started - {type.title()} Client {client_id}",
+                    ),
+                    client,
                 )
                 multi_clients[client_id] = client
                 work_loads[client_id] = 0
+                stream_loads[client_id] = 0
+                client_dcs[client_id] = await client.storage.dc_id()
             elif type == "user":
                 client = await Client(
                     name=str(client_id),
@@ -57,9 +90,13 @@ async def initialize_clients():
                     workdir=session_cache_path,
                     no_updates=True,
                 ).start()
-                await client.send_message(
-                    config.STORAGE_CHANNEL,
-                    f"Started - {type.title()} Client {client_id}",
+                await SCHEDULER.call(
+                    "send",
+                    lambda c: c.send_message(
+                        config.STORAGE_CHANNEL,
+                        f"Started - {type.title()} Client {client_id}",
+                    ),
+                    client,
                 )
                 premium_clients[client_id] = client
                 premium_work_loads[client_id] = 0
@@ -111,3 +148,133 @@ def get_client(premium_required=False) -> Client:
     index = min(work_loads, key=work_loads.get)
     work_loads[index] += 1
     return multi_clients[index]
+
+
+def get_client_pool(premium_required=False) -> list:
+    """Clients a call can be rerouted to when its client is in a FloodWait"""
+    if premium_required:
+        return list(premium_clients.values())
+    return list(multi_clients.values())
+
+
+class StreamLease:
+    """Counts one stream against a client until released, at most once"""
+
+    def __init__(self, client_id) -> None:
+        self.client_id = client_id
+        self.released = False
+        stream_loads[client_id] += 1
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            stream_loads[self.client_id] -= 1
+
+    def __del__(self) -> None:
+        self.release()
+
+
+def get_stream_client(key):
+    """
+    Picks the client to stream the file identified by `key`, preferring the one
+    that served it last so its FileId cache and media session are reused.
+    Returns the client and a StreamLease to release once the stream ends.
+    """
+    least_busy = min(stream_loads, key=lambda id: (stream_loads[id], work_loads[id]))
+
+    client_id = None
+    affinity = file_affinity.get(key)
+    if affinity and time.monotonic() - affinity[1] < AFFINITY_WINDOW:
+        if stream_loads[affinity[0]] - stream_loads[least_busy] < AFFINITY_LOAD_SLACK:
+            client_id = affinity[0]
+            stream_stats["warmed_hits" if affinity[2] else "affinity_hits"] += 1
+        else:
+            stream_stats["affinity_overloaded"] += 1
+    else:
+        stream_stats["affinity_misses"] += 1
+
+    if client_id is None:
+        client_id = get_warm_client(file_dcs.get(key), least_busy)
+
+    file_affinity[key] = (client_id, time.monotonic(), False)
+    file_affinity.move_to_end(key)
+    while len(file_affinity) > MAX_AFFINITY_ENTRIES:
+        file_affinity.popitem(last=False)
+
+    work_loads[client_id] += 1
+    return multi_clients[client_id], StreamLease(client_id)
+
+
+def has_warm_session(client_id, dc_id) -> bool:
+    """Whether a client can fetch from a DC without exporting its authorization"""
+    return client_dcs.get(client_id) == dc_id or dc_id in getattr(
+        multi_clients[client_id], "media_sessions", {}
+    )
+
+
+def get_warm_client(dc_id, least_busy):
+    """
+    The least busy client that is homed on or already has a media session for
+    `dc_id`, unless it is much busier than the least busy client overall.
+    """
+    if dc_id is None:
+        return least_busy
+
+    warm = [id for id in stream_loads if has_warm_session(id, dc_id)]
+    if warm:
+        client_id = min(warm, key=lambda id: (stream_loads[id], work_loads[id]))
+        if stream_loads[client_id] - stream_loads[least_busy] < AFFINITY_LOAD_SLACK:
+            stream_stats["dc_warm"] += 1
+            return client_id
+
+    stream_stats["dc_cold"] += 1
+    return least_busy
+
+
+def remember_file_dc(key, dc_id) -> None:
+    file_dcs[key] = dc_id
+    file_dcs.move_to_end(key)
+    while len(file_dcs) > MAX_AFFINITY_ENTRIES:
+        file_dcs.popitem(last=False)
+
+
+def get_idle_client():
+    """The client serving the fewest streams, with its id"""
+    client_id = min(stream_loads, key=lambda id: (stream_loads[id], work_loads[id]))
+    return client_id, multi_clients[client_id]
+
+
+def has_affinity(key) -> bool:
+    """Whether streams of the file still go to the client that last had it"""
+    affinity = file_affinity.get(key)
+    return affinity is not None and time.monotonic() - affinity[1] < AFFINITY_WINDOW
+
+
+def set_file_affinity(keys, client_id) -> None:
+    """Points upcoming streams of these files at a client that has them warm"""
+    now = time.monotonic()
+    for key in keys:
+        file_affinity[key] = (client_id, now, True)
+        file_affinity.move_to_end(key)
+        stream_stats["warmed_files"] += 1
+    while len(file_affinity) > MAX_AFFINITY_ENTRIES:
+        file_affinity.popitem(last=False)
+
+
+def get_stream_stats() -> dict:
+    from utils.streamer.custom_dl import HEDGE_STATS
+
+    hits = stream_stats["affinity_hits"] + stream_stats["warmed_hits"]
+    lookups = hits + stream_stats["affinity_misses"] + stream_stats["affinity_overloaded"]
+    return {
+        **stream_stats,
+        "affinity_hit_rate": hits / lookups if lookups else 0,
+        "stream_loads": dict(stream_loads),
+        "hedging": dict(HEDGE_STATS),
+        "scheduler": SCHEDULER.get_stats(),
+        "client_dcs": dict(client_dcs),
+        "media_session_dcs": {
+            id: sorted(getattr(client, "media_sessions", {}))
+            for id, client in multi_clients.items()
+        },
+    }
@@ -1,9 +1,14 @@
 from pathlib import Path
+from collections import deque
+from contextlib import contextmanager
 import sys
 import config, dill
 from pyrogram.types import InputMediaDocument, Message
 import os, random, string, asyncio
+from utils.folder_index import FolderIndex
 from utils.logger import Logger
+from utils.placement import STORAGE
+from utils.scheduler import SCHEDULER
 from datetime import datetime, timezone
 import os
 import signal
@@ -14,6 +19,9 @@ cache_dir = Path("./cache")
 cache_dir.mkdir(parents=True, exist_ok=True)
 drive_cache_path = cache_dir / "drive.data"
 
+# Changes kept for delta sync, clients further behind must re-fetch everything
+CHANGE_LOG_SIZE = 10000
+
 
 def getRandomID():
     global DRIVE_DATA
@@ -26,6 +34,17 @@ def getRandomID():
             return id
 
 
+def split_item_path(path: str):
+    """Splits "/folder/.../item_id" into the parent folder path and the item id"""
+    if len(path.strip("/").split("/")) > 0:
+        folder_path = "/" + "/".join(path.strip("/").split("/")[:-1])
+        item_id = path.strip("/").split("/")[-1]
+    else:
+        folder_path = "/"
+        item_id = path.strip("/")
+    return folder_path, item_id
+
+
 def get_current_utc_time():
     return datetime.now(timezone.utc).strftime("Date - %Y-%m-%d | Time - %H:%M:%S")
 
@@ -43,6 +62,12 @@ class Folder:
         self.path = ("/" + path.strip("/") + "/").replace("//", "/")
         self.upload_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         self.auth_hashes = []
+        self.version = 0  # bumped on every change to the folder's children
+
+        # Recursive totals of the non-trashed items below this folder
+        self.size = 0
+        self.file_count = 0
+        self.folder_count = 0
 
 
 class File:
@@ -52,68 +77,335 @@ class File:
         file_id: int,
         size: int,
         path: str,
+        file_hash: str = None,
+        parts: list = None,
+        unique_id: str = None,
+        channel: int = None,
     ) -> None:
         self.name = name
         self.file_id = file_id
+        # Storage channel holding the file's message(s)
+        self.channel = channel or config.STORAGE_CHANNEL
         self.id = getRandomID()
         self.size = size
+        self.hash = file_hash
+        self.unique_id = unique_id  # Telegram's file_unique_id, when known
+        # Ordered [(message_id, size), ...] when the file is split across messages
+        self.parts = parts
         self.type = "file"
         self.trash = False
         self.path = path[:-1] if path[-1] == "/" else path
         self.upload_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
 
+def get_item_totals(item):
+    """(size, files, folders) an item adds to the totals of its parent folder"""
+    if item.type == "folder":
+        return item.size, item.file_count, item.folder_count + 1
+    return item.size, 1, 0
+
+
+def get_content_id(file: File) -> str:
+    """
+    Stable id of a file's content, used in its unauthenticated /f/ URL.
+    Telegram's file_unique_id or the SHA-256 when known. Files with neither
+    get None and are only served through /file, as their storage message
+    ids are sequential and could be walked.
+    """
+    if file.unique_id:
+        return file.unique_id
+    if file.hash:
+        return file.hash.split(":", 1)[1]
+    return None
+
+
+def set_item_path(item, directory_path: str) -> None:
+    """Points an item (and everything below a folder) at a new parent directory"""
+    if item.type == "folder":
+        item.path = ("/" + directory_path.strip("/") + "/").replace("//", "/")
+        for child in item.contents.values():
+            set_item_path(child, item.path + item.id)
+    else:
+        item.path = directory_path[:-1] if directory_path[-1] == "/" else directory_path
+
+
 class NewDriveData:
     def __init__(self, contents: dict, used_ids: list) -> None:
         self.contents = contents
         self.used_ids = used_ids
         self.isUpdated = False
 
+        # Maps "sha256:<hex>" / "tg:<file_unique_id>" keys to
+        # (message_id, size, parts, channel)
+        self.hash_index = {}
+
+        # Sequence number of the latest mutation and the most recent changes
+        self.change_seq = 0
+        self.change_log = deque(maxlen=CHANGE_LOG_SIZE)
+
+        self._init_runtime_state()
+
+    def _init_runtime_state(self) -> None:
+        self._batch_depth = 0
+        self._save_pending = False
+        self._folder_indexes = {}  # folder id -> FolderIndex, built on first listing
+
+        # Share auth hash -> shared Folder, item id -> parent folder id and
+        # content id -> {file id: File}, built on first use by _ensure_lookup_indexes()
+        self._auth_index = None
+        self._parent_index = None
+        self._content_index = None
+
+    def __getstate__(self):
+        # Runtime-only state (prefixed with "_") is rebuilt on load, not persisted
+        return {k: v for k, v in self.__dict__.items() if not k.startswith("_")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._init_runtime_state()
+
     def save(self) -> None:
+        if self._batch_depth:
+            self._save_pending = True
+            return
+
         with open(drive_cache_path, "wb") as f:
             dill.dump(self, f)
         self.isUpdated = True
         logger.info("Drive data saved successfully.")
 
+    @contextmanager
+    def batch(self):
+        """Groups several mutations so they are persisted with a single save()"""
+        self._batch_depth += 1
+        try:
+            yield
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._save_pending:
+                self._save_pending = False
+                self.save()
+
     def new_folder(self, path: str, name: str) -> None:
         logger.info(f"Creating new folder '{name}' in path '{path}'.")
 
         folder = Folder(name, path)
         if path == "/":
             directory_folder: Folder = self.contents[path]
-            directory_folder.contents[folder.id] = folder
         else:
             paths = path.strip("/").split("/")
             directory_folder: Folder = self.contents["/"]
             for path in paths:
                 directory_folder = directory_folder.contents[path]
-            directory_folder.contents[folder.id] = folder
+        self._attach(directory_folder, folder)
+        self._record_change("create", folder)
 
         self.save()
         return folder.path + folder.id
 
-    def new_file(self, path: str, name: str, file_id: int, size: int) -> None:
+    def new_file(
+        self,
+        path: str,
+        name: str,
+        file_id: int,
+        size: int,
+        file_hash: str = None,
+        unique_id: str = None,
+        parts: list = None,
+        channel: int = None,
+    ) -> File:
         logger.info(f"Creating new file '{name}' in path '{path}'.")
 
-        file = File(name, file_id, size, path)
+        file = File(name, file_id, size, path, file_hash, parts, unique_id, channel)
         if path == "/":
             directory_folder: Folder = self.contents[path]
-            directory_folder.contents[file.id] = file
         else:
             paths = path.strip("/").split("/")
             directory_folder: Folder = self.contents["/"]
             for path in paths:
                 directory_folder = directory_folder.contents[path]
-            directory_folder.contents[file.id] = file
+        self._attach(directory_folder, file)
+        self._record_change("create", file)
+
+        for key in (file_hash, f"tg:{unique_id}" if unique_id else None):
+            if key and key not in self.hash_index:
+                self.hash_index[key] = (file_id, size, parts, file.channel)
 
         self.save()
+        return file
+
+    def _ensure_lookup_indexes(self) -> None:
+        if self._auth_index is not None:
+            return
+        self._auth_index = {}
+        self._parent_index = {}
+        self._content_index = {}
+        root = self.contents["/"]
+        self._index_subtree(root, None)
+
+    def _index_subtree(self, item, parent_id) -> None:
+        self._parent_index[item.id] = parent_id
+        if item.type == "folder":
+            for auth in getattr(item, "auth_hashes", []):
+                self._auth_index[auth] = item
+            for child in item.contents.values():
+                self._index_subtree(child, item.id)
+        elif get_content_id(item):
+            self._content_index.setdefault(get_content_id(item), {})[item.id] = item
+
+    def _unindex_subtree(self, item) -> None:
+        self._parent_index.pop(item.id, None)
+        if item.type == "folder":
+            for auth in item.auth_hashes:
+                self._auth_index.pop(auth, None)
+            for child in item.contents.values():
+                self._unindex_subtree(child)
+        else:
+            content_id = get_content_id(item)
+            files = self._content_index.get(content_id, {})
+            files.pop(item.id, None)
+            if not files:
+                self._content_index.pop(content_id, None)
+
+    def _attach(self, folder: Folder, item) -> None:
+        folder.contents[item.id] = item
+        if self._auth_index is not None:
+            self._index_subtree(item, folder.id)
+        self._item_changed(folder, item)
+        if not item.trash:
+            self._update_totals(folder, *get_item_totals(item))
+
+    def _detach(self, folder: Folder, item_id: str):
+        item = folder.contents.pop(item_id)
+        folder.version += 1
+        if self._auth_index is not None:
+            self._unindex_subtree(item)
+        index = self._folder_indexes.get(folder.id)
+        if index is not None:
+            index.remove(item_id)
+
+        def drop_indexes(item):
+            if item.type == "folder":
+                self._folder_indexes.pop(item.id, None)
+                for child in item.contents.values():
+                    drop_indexes(child)
+
+        drop_indexes(item)
+        if not item.trash:
+            self._update_totals(folder, *(-total for total in get_item_totals(item)))
+        return item
+
+    def _update_totals(self, folder: Folder, size: int, files: int, folders: int):
+        """
+        Adds to the recursive totals of `folder` and its ancestors, up to the
+        first trashed one as trashed folders don't count towards their parent.
+        """
+        chain = [self.contents["/"]]
+        if folder is not chain[0]:
+            for folder_id in folder.path.strip("/").split("/") + [folder.id]:
+                if folder_id:
+                    chain.append(chain[-1].contents[folder_id])
+
+        for depth in range(len(chain) - 1, -1, -1):
+            current = chain[depth]
+            current.size += size
+            current.file_count += files
+            current.folder_count += folders
+            if current.trash or depth == 0:
+                return
+
+            # The parent lists `current` with its totals, so its listing changed
+            parent = chain[depth - 1]
+            parent.version += 1
+            index = self._folder_indexes.get(parent.id)
+            if index is not None:
+                index.add(current)
+
+    def _item_changed(self, folder: Folder, item) -> None:
+        """Refreshes the listing index of `folder` after `item` was added or edited"""
+        folder.version += 1
+        index = self._folder_indexes.get(folder.id)
+        if index is None:
+            return
+        if item.trash:
+            index.remove(item.id)
+        else:
+            index.add(item)
+
+    def _bump_versions(self, item) -> None:
+        """
+        Bumps the version of a folder and of every folder below it, whose
+        cached listings went stale as the paths of their children changed
+        """
+        if item.type != "folder":
+            return
+        item.version += 1
+        for child in item.contents.values():
+            self._bump_versions(child)
+
+    def _record_change(self, op: str, item, **extra) -> None:
+        """Appends a mutation of `item` to the change feed read by get_changes()"""
+        self.change_seq += 1
+        change = {
+            "seq": self.change_seq,
+            "op": op,
+            "type": item.type,
+            "id": item.id,
+            "path": (item.path + "/" + item.id).replace("//", "/"),
+            "name": item.name,
+            "trash": item.trash,
+        }
+        if item.type == "file":
+            change["size"] = item.size
+        change.update(extra)
+        self.change_log.append(change)
+
+    def get_changes(self, since: int, limit: int = 1000):
+        """
+        Returns up to `limit` changes with a sequence number above `since` and
+        the sequence to resume from. `reset` is True when changes after `since`
+        already fell out of the log, the client then has to re-fetch everything.
+        """
+        oldest = self.change_log[0]["seq"] if self.change_log else self.change_seq + 1
+        reset = since < oldest - 1
+        changes = [change for change in self.change_log if change["seq"] > since]
+        changes = changes[:limit]
+        next_seq = changes[-1]["seq"] if changes else max(since, self.change_seq)
+        return changes, next_seq, reset
+
+    def list_directory(
+        self, folder: Folder, sort: str, order: str, limit: int, cursor: str = None
+    ):
+        """
+        Returns one page of the non-trashed children of `folder`, the cursor of
+        the next page (None on the last one) and the total number of children.
+        """
+        index = self._folder_indexes.get(folder.id)
+        if index is None:
+            index = FolderIndex(folder)
+            self._folder_indexes[folder.id] = index
+
+        ids, next_cursor = index.page(sort, order, limit, cursor)
+        return {id: folder.contents[id] for id in ids}, next_cursor, len(index)
+
+    def find_duplicate(self, *keys: str):
+        """
+        Returns the (message_id, size, parts, channel) of an already stored file
+        matching any of the given content keys, or None if the content was never
+        uploaded. Older entries lack parts and channel, which are filled in.
+        """
+        for key in keys:
+            if key and key in self.hash_index:
+                message_id, size, *rest = self.hash_index[key]
+                parts = rest[0] if len(rest) > 0 else None
+                channel = rest[1] if len(rest) > 1 else config.STORAGE_CHANNEL
+                return message_id, size, parts, channel
+        return None
 
     def get_directory(
         self, path: str, is_admin: bool = True, auth: str = None
     ) -> Folder:
         folder_data: Folder = self.contents["/"]
-        auth_success = False
-        auth_home_path = None
 
         if path != "/":
             path = path.strip("/")
@@ -126,22 +418,38 @@ class NewDriveData:
             for folder in path:
                 folder_data = folder_data.contents[folder]
 
-                if auth in folder_data.auth_hashes:
-                    auth_success = True
-                    auth_home_path = (
-                        "/" + folder_data.path.strip("/") + "/" + folder_data.id
-                    )
+        shared_folder = self.get_shared_folder(auth, folder_data.id)
 
-        if not is_admin and not auth_success:
+        if not is_admin and shared_folder is None:
             logger.warning(f"Unauthorized access attempt to path '{path}'.")
             return None
 
-        if auth_success:
+        if shared_folder is not None:
             logger.info(f"Authorization successful for path '{path}'.")
+            auth_home_path = "/" + shared_folder.path.strip("/") + "/" + shared_folder.id
             return folder_data, auth_home_path
 
         return folder_data
 
+    def get_shared_folder(self, auth: str, item_id: str):
+        """
+        Returns the folder shared through `auth` if the item with `item_id` is
+        that folder or lies below it, else None.
+        """
+        if not auth:
+            return None
+        self._ensure_lookup_indexes()
+
+        shared_folder = self._auth_index.get(auth)
+        if shared_folder is None:
+            return None
+
+        while item_id is not None:
+            if item_id == shared_folder.id:
+                return shared_folder
+            item_id = self._parent_index.get(item_id)
+        return None
+
     def get_folder_auth(self, path: str) -> None:
         auth = getRandomID()
         folder_data: Folder = self.contents["/"]
@@ -158,47 +466,133 @@ class NewDriveData:
                 folder_data = folder_data.contents[folder]
 
         folder_data.auth_hashes.append(auth)
+        if self._auth_index is not None:
+            self._auth_index[auth] = folder_data
         self.save()
         logger.info(f"Authorization hash generated for path '{path}'.")
         return auth
 
+    def revoke_folder_auth(self, auth: str) -> None:
+        """Invalidates a share link, the folder stays shared through its other links"""
+        self._ensure_lookup_indexes()
+        folder_data = self._auth_index.pop(auth, None)
+        if folder_data is None:
+            raise KeyError("Unknown share auth")
+
+        folder_data.auth_hashes.remove(auth)
+        self.save()
+        logger.info(f"Authorization hash revoked for folder '{folder_data.id}'.")
+
+    def get_file_by_content_id(self, content_id: str) -> File:
+        """Returns a non-trashed file on the drive with the given content id"""
+        self._ensure_lookup_indexes()
+        for file in self._content_index.get(content_id, {}).values():
+            if not file.trash:
+                return file
+        raise Exception("File not found")
+
     def get_file(self, path) -> File:
-        if len(path.strip("/").split("/")) > 0:
-            folder_path = "/" + "/".join(path.strip("/").split("/")[:-1])
-            file_id = path.strip("/").split("/")[-1]
-        else:
-            folder_path = "/"
-            file_id = path.strip("/")
+        folder_path, file_id = split_item_path(path)
 
         folder_data = self.get_directory(folder_path)
         return folder_data.contents[file_id]
 
     def rename_file_folder(self, path: str, new_name: str) -> None:
-        if len(path.strip("/").split("/")) > 0:
-            folder_path = "/" + "/".join(path.strip("/").split("/")[:-1])
-            file_id = path.strip("/").split("/")[-1]
-        else:
-            folder_path = "/"
-            file_id = path.strip("/")
+        folder_path, file_id = split_item_path(path)
         folder_data = self.get_directory(folder_path)
         folder_data.contents[file_id].name = new_name
+        self._item_changed(folder_data, folder_data.contents[file_id])
+        self._record_change("rename", folder_data.contents[file_id])
         self.save()
         logger.info(f"Item at path '{path}' renamed to '{new_name}'.")
 
     def trash_file_folder(self, path: str, trash: bool) -> None:
         action = "Trashing" if trash else "Restoring"
 
-        if len(path.strip("/").split("/")) > 0:
-            folder_path = "/" + "/".join(path.strip("/").split("/")[:-1])
-            file_id = path.strip("/").split("/")[-1]
-        else:
-            folder_path = "/"
-            file_id = path.strip("/")
+        folder_path, file_id = split_item_path(path)
         folder_data = self.get_directory(folder_path)
-        folder_data.contents[file_id].trash = trash
+        item = folder_data.contents[file_id]
+        if item.trash != trash:
+            totals = get_item_totals(item)
+            self._update_totals(folder_data, *(t if not trash else -t for t in totals))
+        item.trash = trash
+        self._item_changed(folder_data, item)
+        self._record_change("trash" if trash else "restore", folder_data.contents[file_id])
         self.save()
         logger.info(f"Item at path '{path}' {action.lower()} successfully.")
 
+    def move_file_folder(self, path: str, destination: str) -> str:
+        """
+        Reparents the item at `path` into the folder at `destination`, only the
+        drive data changes as the Telegram messages stay where they are.
+        """
+        folder_path, item_id = split_item_path(path)
+        folder_data = self.get_directory(folder_path)
+        item = folder_data.contents[item_id]
+
+        destination = "/" + destination.strip("/")
+        if item.type == "folder" and item_id in destination.strip("/").split("/"):
+            raise Exception("Cannot move a folder into itself")
+
+        destination_folder = self.get_directory(destination)
+        self._detach(folder_data, item_id)
+        set_item_path(item, destination)
+        self._bump_versions(item)
+        self._attach(destination_folder, item)
+        self._record_change("move", item, old_path=path)
+
+        self.save()
+        logger.info(f"Item at path '{path}' moved to '{destination}'.")
+        return (destination + "/" + item_id).replace("//", "/")
+
+    def apply_operations(self, operations: list) -> None:
+        """
+        Applies a list of {"op", "path", ...} operations atomically, either all
+        of them take effect, persisted with a single save, or none do.
+        """
+        undo = []
+        change_seq = self.change_seq
+        # A full feed drops its oldest entries on append, popping can't undo that
+        change_log = self.change_log.copy()
+        with self.batch():
+            try:
+                for operation in operations:
+                    undo.append(self._apply_operation(operation))
+            except Exception:
+                for revert in reversed(undo):
+                    revert()
+
+                # Nothing happened as far as the change feed is concerned
+                self.change_log = change_log
+                self.change_seq = change_seq
+                self._save_pending = False
+                raise
+
+    def _apply_operation(self, operation: dict):
+        op = operation["op"]
+        path = operation["path"]
+        folder_path, item_id = split_item_path(path)
+        folder_data = self.get_directory(folder_path)
+        item = folder_data.contents[item_id]
+
+        if op == "rename":
+            if not operation.get("name", "").strip():
+                raise Exception("Name cannot be empty")
+            old_name = item.name
+            self.rename_file_folder(path, operation["name"])
+            return lambda: self.rename_file_folder(path, old_name)
+        elif op in ("trash", "restore"):
+            old_trash = item.trash
+            self.trash_file_folder(path, op == "trash")
+            return lambda: self.trash_file_folder(path, old_trash)
+        elif op == "delete":
+            self.delete_file_folder(path)
+            return lambda: self._attach(folder_data, item)
+        elif op == "move":
+            new_path = self.move_file_folder(path, operation["destination"])
+            return lambda: self.move_file_folder(new_path, folder_path)
+        raise Exception(f"Unknown operation '{op}'")
+
     def get_trashed_files_folders(self):
         root_dir = self.get_directory("/")
         trash_data = {}
@@ -220,15 +614,11 @@ class NewDriveData:
 
     def delete_file_folder(self, path: str) -> None:
 
-        if len(path.strip("/").split("/")) > 0:
-            folder_path = "/" + "/".join(path.strip("/").split("/")[:-1])
-            file_id = path.strip("/").split("/")[-1]
-        else:
-            folder_path = "/"
-            file_id = path.strip("/")
+        folder_path, file_id = split_item_path(path)
 
         folder_data = self.get_directory(folder_path)
-        del folder_data.contents[file_id]
+        item = self._detach(folder_data, file_id)
+        self._record_change("delete", item)
         self.save()
         logger.info(f"Item at path '{path}' deleted successfully.")
 
@@ -294,18 +684,26 @@ async def backup_drive_data(loop=True):
             )
 
             media_doc = InputMediaDocument(drive_cache_path, caption=caption)
-            msg = await client.edit_message_media(
-                config.STORAGE_CHANNEL,
-                config.DATABASE_BACKUP_MSG_ID,
-                media=media_doc,
-                file_name="drive.data",
+            msg = await SCHEDULER.call(
+                "edit",
+                lambda client: client.edit_message_media(
+                    config.BACKUP_CHANNEL,
+                    config.DATABASE_BACKUP_MSG_ID,
+                    media=media_doc,
+                    file_name="drive.data",
+                ),
+                client,
             )
 
             DRIVE_DATA.isUpdated = False
             logger.info("Drive data backed up to Telegram successfully.")
 
             try:
-                await msg.pin()
+                await SCHEDULER.call(
+                    "edit",
+                    lambda client: client.pin_chat_message(config.BACKUP_CHANNEL, msg.id),
+                    client,
+                )
             except Exception as pin_e:
                 logger.error(f"Error pinning backup message: {pin_e}")
 
@@ -325,14 +723,48 @@ async def init_drive_data():
     root_dir = DRIVE_DATA.get_directory("/")
     if not hasattr(root_dir, "auth_hashes"):
         root_dir.auth_hashes = []
+    if not hasattr(root_dir, "version"):
+        root_dir.version = 0
+
+    if not hasattr(DRIVE_DATA, "hash_index"):
+        DRIVE_DATA.hash_index = {}
+    if not hasattr(DRIVE_DATA, "change_log"):
+        DRIVE_DATA.change_seq = 0
+        DRIVE_DATA.change_log = deque(maxlen=CHANGE_LOG_SIZE)
+
+    # Deduplicated files share their messages, which only take space once
+    recorded = set()
 
     def traverse_directory(folder):
+        # Folder totals are recomputed bottom-up, which also fills them in for
+        # drive data saved before they existed
+        folder.size = folder.file_count = folder.folder_count = 0
         for item in folder.contents.values():
             if item.type == "folder":
                 traverse_directory(item)
 
                 if not hasattr(item, "auth_hashes"):
                     item.auth_hashes = []
+                if not hasattr(item, "version"):
+                    item.version = 0
+            else:
+                if not hasattr(item, "hash"):
+                    item.hash = None
+                if not hasattr(item, "parts"):
+                    item.parts = None
+                if not hasattr(item, "unique_id"):
+                    item.unique_id = None
+                if not hasattr(item, "channel"):
+                    item.channel = config.STORAGE_CHANNEL
+                if (item.channel, item.file_id) not in recorded:
+                    recorded.add((item.channel, item.file_id))
+                    STORAGE.record(item.channel, item.size)
+
+            if not item.trash:
+                size, files, folders = get_item_totals(item)
+                folder.size += size
+                folder.file_count += files
+                folder.folder_count += folders
 
     traverse_directory(root_dir)
     DRIVE_DATA.save()
@@ -343,13 +775,18 @@ async def loadDriveData():
     global DRIVE_DATA, BOT_MODE
 
     logger.info("Loading drive data.")
-    from utils.clients import get_client
+    from utils.clients import get_client, get_client_pool
 
     client = get_client()
     try:
         try:
-            msg: Message = await client.get_messages(
-                config.STORAGE_CHANNEL, config.DATABASE_BACKUP_MSG_ID
+            msg: Message = await SCHEDULER.call(
+                "read",
+                lambda client: client.get_messages(
+                    config.BACKUP_CHANNEL, config.DATABASE_BACKUP_MSG_ID
+                ),
+                client,
+                pool=get_client_pool(),
             )
         except Exception as e:
             logger.error(f"Error fetching backup message: {e}")
@@ -1,94 +1,390 @@
-import os
-import aiohttp, asyncio
+import os, time
+import aiohttp, asyncio, hashlib, math
+from contextlib import asynccontextmanager
+from urllib.parse import urlparse
+from config import MAX_FILE_SIZE, REMOTE_IMPORT_CONCURRENCY, REMOTE_IMPORT_PER_HOST
 from utils.extra import get_filename
 from utils.logger import Logger
 from pathlib import Path
-from utils.uploader import start_file_uploader
+from utils.uploader import start_file_uploader, start_stream_uploader
+from utils.jobs import JOBS
 from techzdl import TechZDL
 
 logger = Logger(__name__)
 
-DOWNLOAD_PROGRESS = {}
-STOP_DOWNLOAD = []
-
 cache_dir = Path("./cache")
 cache_dir.mkdir(parents=True, exist_ok=True)
 
+# Parallel ranged connections used per remote file
+DOWNLOAD_CONNECTIONS = 8
 
-async def download_progress_callback(status, current, total, id):
-    global DOWNLOAD_PROGRESS
+# Bytes fetched per ranged request, a multiple of the Telegram upload part size
+SEGMENT_SIZE = 4 * 1024 * 1024
 
-    DOWNLOAD_PROGRESS[id] = (
-        status,
-        current,
-        total,
-    )
+# Downloaded segments allowed to wait for the uploader, bounds memory per import
+MAX_BUFFERED_SEGMENTS = 16
 
+MAX_RETRIES = 5
 
-async def download_file(url, id, path, filename, singleThreaded):
-    global DOWNLOAD_PROGRESS, STOP_DOWNLOAD
+# Probe results are reused for this many seconds, e.g. info lookup then import
+PROBE_CACHE_TTL = 10 * 60
 
-    logger.info(f"Downloading file from {url}")
+HTTP_SESSION: aiohttp.ClientSession = None
+PROBE_CACHE = {}
+IMPORT_SLOTS = None
+HOST_SLOTS = {}  # host -> [semaphore, imports holding or waiting for it]
 
-    try:
-        downloader = TechZDL(
-            url,
-            output_dir=cache_dir,
-            debug=False,
-            progress_callback=download_progress_callback,
-            progress_args=(id,),
-            max_retries=5,
-            single_threaded=singleThreaded,
+
+def get_http_session() -> aiohttp.ClientSession:
+    """Pooled HTTP session shared by every remote import"""
+    global HTTP_SESSION
+
+    if HTTP_SESSION is None or HTTP_SESSION.closed:
+        connector = aiohttp.TCPConnector(
+            limit=REMOTE_IMPORT_CONCURRENCY * DOWNLOAD_CONNECTIONS,
+            limit_per_host=REMOTE_IMPORT_PER_HOST * DOWNLOAD_CONNECTIONS,
         )
-        await downloader.start(in_background=True)
+        HTTP_SESSION = aiohttp.ClientSession(
+            connector=connector, timeout=aiohttp.ClientTimeout(sock_read=60)
+        )
+    return HTTP_SESSION
 
-        await asyncio.sleep(5)
 
-        while downloader.is_running:
-            if id in STOP_DOWNLOAD:
-                logger.info(f"Stopping download {id}")
-                await downloader.stop()
-                return
-            await asyncio.sleep(1)
+async def close_http_session() -> None:
+    if HTTP_SESSION is not None and not HTTP_SESSION.closed:
+        await HTTP_SESSION.close()
 
-        if downloader.download_success is False:
-            raise downloader.download_error
 
-        DOWNLOAD_PROGRESS[id] = (
-            "completed",
-            downloader.total_size,
-            downloader.total_size,
-        )
+@asynccontextmanager
+async def host_slot(host):
+    """Bounds concurrent imports per host, dropping a host's entry once unused"""
+    slot = HOST_SLOTS.setdefault(host, [asyncio.Semaphore(REMOTE_IMPORT_PER_HOST), 0])
+    slot[1] += 1
+    try:
+        async with slot[0]:
+            yield
+    finally:
+        slot[1] -= 1
+        if not slot[1]:
+            del HOST_SLOTS[host]
+
+
+async def download_progress_callback(status, current, total, id):
+    JOBS.update(id, "download", status, current, total)
+
+
+class RangeReader:
+    """
+    Downloads a remote file over several ranged connections into an ordered
+    reassembly buffer and exposes it as a sequential stream through read().
+    Workers stay at most MAX_BUFFERED_SEGMENTS ahead of the reader.
+    """
+
+    def __init__(
+        self, session: aiohttp.ClientSession, url, id, total_size, connections
+    ) -> None:
+        self.session = session
+        self.url = url
+        self.id = id
+        self.total_size = total_size
+        self.connections = connections
+        self.segment_count = math.ceil(total_size / SEGMENT_SIZE)
+
+        self.segments = {}
+        self.next_fetch = 0
+        self.next_read = 0
+        self.current = b""
+        self.position = 0
+        self.downloaded = 0
+        self.error = None
+        self.condition = asyncio.Condition()
+        self.hasher = hashlib.sha256()
+        self.tasks = []
+
+    @property
+    def file_hash(self) -> str:
+        return f"sha256:{self.hasher.hexdigest()}"
 
-        logger.info(f"File downloaded to {downloader.output_path}")
+    def start(self) -> None:
+        if self.connections > 1:
+            self.tasks = [
+                asyncio.create_task(self._range_worker())
+                for _ in range(min(self.connections, self.segment_count))
+            ]
+        else:
+            self.tasks = [asyncio.create_task(self._sequential_worker())]
 
-        # 🔥 CRITICAL FIX: Use actual downloaded filename if no filename provided
-        final_filename = filename
-        if not final_filename or final_filename.strip() == "":
-            # Extract filename from the downloaded file path
-            final_filename = Path(downloader.output_path).name
-            logger.info(f"No filename provided, using: {final_filename}")
-        
-        logger.info(f"Starting upload with filename: {final_filename}")
+    async def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
 
-        asyncio.create_task(
-            start_file_uploader(
-                downloader.output_path, id, path, final_filename, downloader.total_size
+    def _has_room(self, index) -> bool:
+        return index < self.next_read + MAX_BUFFERED_SEGMENTS
+
+    async def _store(self, index, data) -> None:
+        async with self.condition:
+            self.segments[index] = data
+            self.downloaded += len(data)
+            status = (
+                "completed" if self.downloaded >= self.total_size else "Downloading"
             )
+            JOBS.update(self.id, "download", status, self.downloaded, self.total_size)
+            self.condition.notify_all()
+
+    async def _fail(self, error) -> None:
+        async with self.condition:
+            self.error = self.error or error
+            self.condition.notify_all()
+
+    async def _fetch_segment(self, index) -> bytes:
+        start = index * SEGMENT_SIZE
+        end = min(start + SEGMENT_SIZE, self.total_size) - 1
+
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                async with self.session.get(
+                    self.url, headers={"Range": f"bytes={start}-{end}"}
+                ) as response:
+                    if response.status != 206:
+                        raise Exception(f"Range request returned {response.status}")
+                    data = await response.read()
+                if len(data) != end - start + 1:
+                    raise Exception(f"Short read for bytes {start}-{end}")
+                return data
+            except Exception as e:
+                if attempt == MAX_RETRIES:
+                    raise
+                logger.warning(f"Retrying segment {index} of {self.url}: {e}")
+                await asyncio.sleep(attempt)
+
+    async def _range_worker(self) -> None:
+        try:
+            while True:
+                async with self.condition:
+                    await self.condition.wait_for(
+                        lambda: self.error
+                        or self.next_fetch >= self.segment_count
+                        or self._has_room(self.next_fetch)
+                    )
+                    if self.error or self.next_fetch >= self.segment_count:
+                        return
+                    index = self.next_fetch
+                    self.next_fetch += 1
+
+                await self._store(index, await self._fetch_segment(index))
+        except Exception as e:
+            await self._fail(e)
+
+    async def _sequential_worker(self) -> None:
+        try:
+            async with self.session.get(self.url) as response:
+                response.raise_for_status()
+                pending = bytearray()
+                index = 0
+                async for chunk in response.content.iter_chunked(256 * 1024):
+                    pending += chunk
+                    while len(pending) >= SEGMENT_SIZE:
+                        async with self.condition:
+                            await self.condition.wait_for(lambda: self._has_room(index))
+                        await self._store(index, bytes(pending[:SEGMENT_SIZE]))
+                        del pending[:SEGMENT_SIZE]
+                        index += 1
+                if pending:
+                    await self._store(index, bytes(pending))
+                    index += 1
+
+            # A clean early end would leave read() waiting on a segment forever
+            if index < self.segment_count or self.downloaded < self.total_size:
+                raise Exception("Remote file ended before the expected size")
+        except Exception as e:
+            await self._fail(e)
+
+    async def read(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            if self.position >= len(self.current):
+                if self.next_read >= self.segment_count:
+                    raise Exception("Remote file ended before the expected size")
+
+                async with self.condition:
+                    await self.condition.wait_for(
+                        lambda: self.error or self.next_read in self.segments
+                    )
+                    if self.error:
+                        raise self.error
+                    self.current = self.segments.pop(self.next_read)
+                    self.position = 0
+                    self.next_read += 1
+                    self.condition.notify_all()
+
+            take = self.current[self.position : self.position + size - len(data)]
+            data += take
+            self.position += len(take)
+
+        data = bytes(data)
+        self.hasher.update(data)
+        return data
+
+
+async def probe_url(url) -> dict:
+    """Reads size, filename and range support of a remote file from its headers"""
+    cached = PROBE_CACHE.get(url)
+    if cached and time.time() - cached[0] < PROBE_CACHE_TTL:
+        return cached[1]
+
+    async with get_http_session().get(url, headers={"Range": "bytes=0-0"}) as response:
+        response.raise_for_status()
+        headers = response.headers
+        final_url = str(response.url)
+
+        if response.status == 206 and "/" in headers.get("Content-Range", ""):
+            total_size = headers["Content-Range"].rsplit("/", 1)[1]
+            accepts_ranges = True
+        else:
+            total_size = headers.get("Content-Length")
+            accepts_ranges = headers.get("Accept-Ranges", "").lower() == "bytes"
+
+    total_size = int(total_size) if total_size and total_size.isdigit() else 0
+    file_info = {
+        "file_size": total_size,
+        "file_name": get_filename(headers, final_url),
+        "accepts_ranges": accepts_ranges,
+    }
+
+    now = time.time()
+    for key, (probed_at, _) in list(PROBE_CACHE.items()):
+        if now - probed_at >= PROBE_CACHE_TTL:
+            del PROBE_CACHE[key]
+    PROBE_CACHE[url] = (now, file_info)
+    return file_info
+
+
+async def stream_file(url, id, path, filename, file_info, singleThreaded):
+    """Feeds remote bytes straight into the Telegram uploader, no cache file"""
+    total_size = file_info["file_size"]
+    if total_size > MAX_FILE_SIZE:
+        raise Exception("File size exceeds limit")
+
+    connections = DOWNLOAD_CONNECTIONS
+    if singleThreaded or not file_info["accepts_ranges"]:
+        connections = 1
+
+    reader = RangeReader(get_http_session(), url, id, total_size, connections)
+    JOBS.update(id, "download", "Downloading", 0, total_size)
+    reader.start()
+    try:
+        await start_stream_uploader(
+            reader, id, path, filename or file_info["file_name"], total_size
         )
-    except Exception as e:
-        DOWNLOAD_PROGRESS[id] = ("error", 0, 0)
-        logger.error(f"Failed to download file: {url} {e}")
+    finally:
+        await reader.close()
 
 
-async def get_file_info_from_url(url):
+async def download_file_to_disk(url, id, path, filename, singleThreaded):
+    """Downloads to ./cache first, used when the remote size isn't known upfront"""
     downloader = TechZDL(
         url,
         output_dir=cache_dir,
         debug=False,
         progress_callback=download_progress_callback,
         progress_args=(id,),
-        max_retries=5,
+        max_retries=MAX_RETRIES,
+        single_threaded=singleThreaded,
+    )
+
+    download = asyncio.create_task(downloader.start())
+    cancel = asyncio.create_task(JOBS.wait_cancelled(id))
+    await asyncio.wait([download, cancel], return_when=asyncio.FIRST_COMPLETED)
+
+    if cancel.done():
+        logger.info(f"Stopping download {id}")
+        await downloader.stop()
+        download.cancel()
+        return
+    cancel.cancel()
+    await download
+
+    if downloader.download_success is False:
+        raise downloader.download_error
+
+    JOBS.update(
+        id, "download", "completed", downloader.total_size, downloader.total_size
+    )
+
+    logger.info(f"File downloaded to {downloader.output_path}")
+
+    # Use actual downloaded filename if no filename provided
+    final_filename = filename
+    if not final_filename or final_filename.strip() == "":
+        final_filename = Path(downloader.output_path).name
+        logger.info(f"No filename provided, using: {final_filename}")
+
+    logger.info(f"Starting upload with filename: {final_filename}")
+
+    await start_file_uploader(
+        downloader.output_path, id, path, final_filename, downloader.total_size
+    )
+
+
+async def download_file(url, id, path, filename, singleThreaded):
+    global IMPORT_SLOTS
+
+    if IMPORT_SLOTS is None:
+        IMPORT_SLOTS = asyncio.Semaphore(REMOTE_IMPORT_CONCURRENCY)
+
+    async with IMPORT_SLOTS, host_slot(urlparse(url).hostname):
+        if JOBS.is_cancelled(id):
+            return
+
+        logger.info(f"Downloading file from {url}")
+
+        try:
+            try:
+                file_info = await probe_url(url)
+            except Exception as e:
+                logger.warning(f"Failed to probe {url}: {e}")
+                file_info = None
+
+            if file_info and file_info["file_size"]:
+                await stream_file(url, id, path, filename, file_info, singleThreaded)
+            else:
+                await download_file_to_disk(url, id, path, filename, singleThreaded)
+        except Exception as e:
+            # Reported on the stage that failed, the one the frontend polls
+            stage = "upload" if JOBS.get(id, "upload") else "download"
+            JOBS.update(id, stage, "error", 0, 0)
+            logger.error(f"Failed to download file: {url} {e}")
+
+
+async def download_files(batch_id, items, singleThreaded):
+    """
+    Imports a list of {"url", "path", "filename"} items. Concurrency is bounded
+    globally and per host by download_file, the batch job aggregates progress.
+    """
+    logger.info(f"Starting batch import {batch_id} of {len(items)} URLs")
+    await asyncio.gather(
+        *(
+            download_file(
+                item["url"], item["id"], item["path"], item.get("filename"), singleThreaded
+            )
+            for item in items
+        )
     )
+    logger.info(f"Finished batch import {batch_id}")
+
+
+async def get_file_info_from_url(url):
+    try:
+        file_info = await probe_url(url)
+        if file_info["file_size"]:
+            return {
+                "file_size": file_info["file_size"],
+                "file_name": file_info["file_name"],
+            }
+    except Exception as e:
+        logger.warning(f"Failed to probe {url}: {e}")
+
+    downloader = TechZDL(url, output_dir=cache_dir, debug=False, max_retries=5)
     file_info = await downloader.get_file_info()
     return {"file_size": file_info["total_size"], "file_name": file_info["filename"]}
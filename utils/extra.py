@@ -5,7 +5,7 @@ import urllib.parse
 from pathlib import Path
 from config import WEBSITE_URL
 import asyncio, aiohttp
-from utils.directoryHandler import get_current_utc_time, getRandomID
+from utils.directoryHandler import get_content_id, get_current_utc_time, getRandomID
 from utils.logger import Logger
 
 logger = Logger(__name__)
@@ -26,6 +26,9 @@ def convert_class_to_dict(data, isObject, showtrash=False):
                     "id": folder.id,
                     "path": folder.path,
                     "upload_date": folder.upload_date,
+                    "size": folder.size,
+                    "file_count": folder.file_count,
+                    "folder_count": folder.folder_count,
                 }
             else:
                 file = data["contents"][key]
@@ -36,6 +39,7 @@ def convert_class_to_dict(data, isObject, showtrash=False):
                     "id": file.id,
                     "path": file.path,
                     "upload_date": file.upload_date,
+                    "content_id": get_content_id(file),
                 }
     return new_data
 
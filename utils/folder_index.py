@@ -0,0 +1,90 @@
+import base64, json
+from bisect import bisect_left, bisect_right, insort
+
+SORT_KEYS = ("name", "size", "date")
+
+
+def sort_value(item, sort: str):
+    if sort == "name":
+        return item.name.lower()
+    if sort == "size":
+        return getattr(item, "size", 0)
+    return item.upload_date
+
+
+def encode_cursor(sort: str, order: str, position) -> str:
+    raw = json.dumps([sort, order, position[0], list(position[1])])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str, sort: str, order: str):
+    try:
+        cursor_sort, cursor_order, group, key = json.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if cursor_sort != sort or cursor_order != order:
+        raise ValueError("Cursor belongs to a different sort order")
+    return group, tuple(key)
+
+
+class FolderIndex:
+    """Sorted keys of a folder's non-trashed children per sort key, folders first"""
+
+    def __init__(self, folder) -> None:
+        self.keys = {}  # item id -> (group, {sort: key})
+        self.sorted = {(group, sort): [] for group in (0, 1) for sort in SORT_KEYS}
+        for item in folder.contents.values():
+            if not item.trash:
+                self.add(item)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, item) -> None:
+        if item.id in self.keys:
+            self.remove(item.id)
+
+        group = 0 if item.type == "folder" else 1
+        keys = {sort: (sort_value(item, sort), item.id) for sort in SORT_KEYS}
+        for sort, key in keys.items():
+            insort(self.sorted[(group, sort)], key)
+        self.keys[item.id] = (group, keys)
+
+    def remove(self, item_id: str) -> None:
+        if item_id not in self.keys:
+            return
+
+        group, keys = self.keys.pop(item_id)
+        for sort, key in keys.items():
+            sorted_keys = self.sorted[(group, sort)]
+            del sorted_keys[bisect_left(sorted_keys, key)]
+
+    def page(self, sort: str, order: str, limit: int, cursor: str = None):
+        """Returns the ids of the next `limit` items and the cursor after them"""
+        reverse = order == "desc"
+        start_group, after = decode_cursor(cursor, sort, order) if cursor else (0, None)
+
+        positions = []
+        for group in range(start_group, 2):
+            sorted_keys = self.sorted[(group, sort)]
+            wanted = limit + 1 - len(positions)  # one extra tells if more remain
+            resume = after is not None and group == start_group
+
+            if reverse:
+                end = bisect_left(sorted_keys, after) if resume else len(sorted_keys)
+                keys = sorted_keys[max(0, end - wanted) : end][::-1]
+            else:
+                start = bisect_right(sorted_keys, after) if resume else 0
+                keys = sorted_keys[start : start + wanted]
+
+            positions += [(group, key) for key in keys]
+            if len(positions) > limit:
+                break
+
+        next_cursor = None
+        if len(positions) > limit:
+            positions = positions[:limit]
+            next_cursor = encode_cursor(sort, order, positions[-1])
+        return [key[1] for _, key in positions], next_cursor
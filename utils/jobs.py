@@ -0,0 +1,190 @@
+import asyncio, json, time
+from collections import OrderedDict
+from utils.logger import Logger
+
+logger = Logger(__name__)
+
+# Finished jobs not updated for this long are evicted
+JOB_TTL = 60 * 60
+
+# Finished jobs kept at most, the least recently updated go first
+MAX_JOBS = 1000
+
+# Minimum delay in seconds between two progress events pushed to a client
+PUSH_INTERVAL = 1
+
+# Comment line sent on idle event streams so proxies keep the connection open
+KEEPALIVE_INTERVAL = 15
+
+
+class Job:
+    def __init__(self, id: str, registry=None) -> None:
+        self.id = id
+        self.registry = registry
+        self.progress = {}  # stage -> (status, current, total)
+        self.cancelled = False
+        self.members = []  # ids of the jobs grouped under a batch job
+        self.batch_id = None
+        self.waiting = 0  # downloads waiting on its cancellation
+        self.updated = time.time()
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        self.updated = time.time()
+        changed, self.changed = self.changed, asyncio.Event()
+        changed.set()
+
+    @property
+    def finished(self) -> bool:
+        if self.cancelled:
+            return True
+        if any(status == "error" for status, _, _ in self.progress.values()):
+            return True
+        if self.members and self.registry is not None:
+            # A batch has no progress of its own, it ends with its last member
+            counts = self.registry.batch_progress(self.id)
+            return counts["queued"] == 0 and counts["running"] == 0
+        return self.progress.get("upload", ("",))[0] == "completed"
+
+    def state(self) -> dict:
+        return {
+            "id": self.id,
+            "progress": self.progress,
+            "cancelled": self.cancelled,
+            "finished": self.finished,
+        }
+
+
+class JobRegistry:
+    """Progress and cancellation state of jobs, keyed by job id"""
+
+    def __init__(self, ttl: int = JOB_TTL, max_jobs: int = MAX_JOBS) -> None:
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+
+    def _get_or_create(self, id: str) -> Job:
+        job = self.jobs.get(id)
+        if job is None:
+            job = Job(id, self)
+            self.jobs[id] = job
+            self.evict()
+        else:
+            self.jobs.move_to_end(id)
+        return job
+
+    def evictable(self, job: Job) -> bool:
+        return job.finished and not job.waiting and job.batch_id not in self.jobs
+
+    def evict(self) -> None:
+        expiry = time.time() - self.ttl
+        excess = len(self.jobs) - self.max_jobs
+        for id, job in list(self.jobs.items()):
+            if excess <= 0 and job.updated >= expiry:
+                break
+            if not self.evictable(job):
+                continue
+            del self.jobs[id]
+            excess -= 1
+            job.notify()
+
+    def update(self, id: str, stage: str, status: str, current: int, total: int) -> None:
+        job = self._get_or_create(id)
+        job.progress[stage] = (status, current, total)
+        job.notify()
+
+        batch = self.jobs.get(job.batch_id)
+        if batch is not None:
+            self.jobs.move_to_end(job.batch_id)
+            batch.notify()
+
+    def get(self, id: str, stage: str):
+        job = self.jobs.get(id)
+        if job is None:
+            return None
+        return job.progress.get(stage)
+
+    def add_members(self, id: str, member_ids: list) -> None:
+        job = self._get_or_create(id)
+        job.members.extend(member_ids)
+        for member_id in member_ids:
+            self._get_or_create(member_id).batch_id = id
+
+    def batch_progress(self, id: str):
+        """Member counts of a batch job, None if the batch is unknown"""
+        job = self.jobs.get(id)
+        if job is None:
+            return None
+
+        counts = {"total": len(job.members), "queued": 0, "running": 0}
+        counts.update({"completed": 0, "error": 0, "current": 0, "size": 0})
+        for member_id in job.members:
+            member = self.jobs.get(member_id)
+            if member is None or not member.progress:
+                counts["queued"] += 1
+                continue
+
+            if member.progress.get("upload", ("",))[0] == "completed":
+                counts["completed"] += 1
+            elif member.finished:
+                counts["error"] += 1
+            else:
+                counts["running"] += 1
+
+            _, current, total = (
+                member.progress.get("download")
+                or member.progress.get("upload")
+                or ("", 0, 0)
+            )
+            counts["current"] += current
+            counts["size"] += total
+        return counts
+
+    def cancel(self, id: str) -> None:
+        job = self._get_or_create(id)
+        job.cancelled = True
+        job.notify()
+        for member_id in job.members:
+            self.cancel(member_id)
+
+    def is_cancelled(self, id: str) -> bool:
+        job = self.jobs.get(id)
+        return job is not None and job.cancelled
+
+    async def wait_cancelled(self, id: str) -> None:
+        """Returns once the job is cancelled"""
+        job = self._get_or_create(id)
+        job.waiting += 1
+        try:
+            while not job.cancelled:
+                await job.changed.wait()
+        finally:
+            job.waiting -= 1
+
+    async def stream_events(self, id: str):
+        """Server-Sent Events stream of a job's progress"""
+        while True:
+            job = self.jobs.get(id)
+            if job is None:
+                yield "event: gone\ndata: {}\n\n"
+                return
+
+            changed = job.changed
+            sent = time.time()
+            yield f"data: {json.dumps(job.state())}\n\n"
+
+            if job.finished:
+                return
+
+            while True:
+                try:
+                    await asyncio.wait_for(changed.wait(), KEEPALIVE_INTERVAL)
+                    break
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+
+            # Coalesce bursts of updates into one event per PUSH_INTERVAL
+            await asyncio.sleep(max(0, PUSH_INTERVAL - (time.time() - sent)))
+
+
+JOBS = JobRegistry()
@@ -0,0 +1,50 @@
+import json
+from collections import OrderedDict
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(data) -> bytes:
+    """Encodes a response body, with orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+class ListingCache:
+    """
+    LRU cache of encoded getDirectory responses, each with the ids of the
+    files it lists. Keys include the folder version, so an entry is never
+    served stale, it just stops being hit.
+    """
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        """Returns (body, file_ids) or None"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key, body: bytes, file_ids: list = ()) -> None:
+        if len(body) > self.max_bytes:
+            return
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key)[0])
+
+        self.entries[key] = (body, file_ids)
+        self.size += len(body)
+        while len(self.entries) > self.max_entries or self.size > self.max_bytes:
+            _, (evicted, _) = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+
+LISTING_CACHE = ListingCache()
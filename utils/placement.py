@@ -0,0 +1,55 @@
+import time
+from config import STORAGE_CHANNELS, STORAGE_PLACEMENT
+from utils.logger import Logger
+
+logger = Logger(__name__)
+
+PLACEMENT_POLICIES = ("round_robin", "lru", "size")
+
+
+class StoragePlacement:
+    """
+    Picks the storage channel a new upload goes to, so Telegram's per-channel
+    rate limits and message history are spread across all of them.
+    """
+
+    def __init__(self, channels: list, policy: str) -> None:
+        if policy not in PLACEMENT_POLICIES:
+            logger.error(f"Unknown storage placement '{policy}', using round_robin")
+            policy = "round_robin"
+        self.channels = list(channels)
+        self.policy = policy
+        self.next_index = 0
+        self.last_used = {channel: 0.0 for channel in self.channels}
+        self.stored_bytes = {channel: 0 for channel in self.channels}
+
+    def record(self, channel: int, size: int) -> None:
+        """Counts `size` bytes as held by `channel`, used by the size policy"""
+        if channel in self.stored_bytes:
+            self.stored_bytes[channel] += size
+
+    def pick(self, size: int = 0) -> int:
+        """
+        Returns the channel for an upload of `size` bytes. The bytes are counted
+        right away so uploads started together don't all land on one channel.
+        """
+        if len(self.channels) == 1:
+            channel = self.channels[0]
+        elif self.policy == "lru":
+            channel = min(self.channels, key=lambda c: self.last_used[c])
+        elif self.policy == "size":
+            channel = min(self.channels, key=lambda c: self.stored_bytes[c])
+        else:
+            channel = self.channels[self.next_index % len(self.channels)]
+            self.next_index += 1
+
+        self.last_used[channel] = time.monotonic()
+        self.record(channel, size)
+        return channel
+
+
+STORAGE = StoragePlacement(STORAGE_CHANNELS, STORAGE_PLACEMENT)
+
+
+def pick_storage_channel(size: int = 0) -> int:
+    return STORAGE.pick(size)
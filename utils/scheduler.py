@@ -0,0 +1,156 @@
+import asyncio, heapq, itertools, time
+from pyrogram.errors import FloodWait
+from utils.logger import Logger
+
+logger = Logger(__name__)
+
+# Call priorities, lower numbers go first when calls queue up on a client
+PRIORITY_STREAM = 0
+PRIORITY_UPLOAD = 1
+PRIORITY_BACKGROUND = 2
+PRIORITY_STATUS = 3
+
+# (requests per second, burst) a single client may spend on each method class
+METHOD_RATES = {
+    "read": (20, 20),  # get_messages
+    "send": (1, 3),  # send_document, send_message, copy
+    "edit": (1, 2),  # edit_text, edit_message_media, pin
+}
+
+# (requests per second, burst) of a single client across all method classes
+CLIENT_RATE = (30, 30)
+
+# FloodWaits a single call absorbs before the error is raised to the caller
+FLOOD_RETRIES = 3
+
+# Method classes safe to repeat on another client of the pool
+REROUTABLE = ("read",)
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, needed: float = 1) -> float:
+        return max(0, (needed - self.tokens) / self.rate)
+
+
+class ClientQueue:
+    """Calls waiting on one client, granted in priority order across method classes"""
+
+    def __init__(self, rates: dict, client_rate: tuple) -> None:
+        self.buckets = {kind: TokenBucket(*rate) for kind, rate in rates.items()}
+        self.client_bucket = TokenBucket(*client_rate)
+        self.waiters = []  # heap of (priority, arrival, kind, future)
+        self.arrivals = itertools.count()
+        self.timer = None
+
+    async def acquire(self, kind: str, priority: int) -> None:
+        # A cancelled caller cancels its future, which dispatch then skips
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (priority, next(self.arrivals), kind, future))
+        self.dispatch()
+        await future
+
+    def dispatch(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        self.client_bucket.refill()
+        for bucket in self.buckets.values():
+            bucket.refill()
+
+        held_back = 0
+        remaining = []
+        while self.waiters:
+            entry = heapq.heappop(self.waiters)
+            _, _, kind, future = entry
+            if future.done():
+                continue
+            bucket = self.buckets[kind]
+            if bucket.tokens >= 1 and self.client_bucket.tokens >= 1 + held_back:
+                bucket.tokens -= 1
+                self.client_bucket.tokens -= 1
+                future.set_result(None)
+            else:
+                # Lower priority calls leave it a client-wide token
+                held_back += 1
+                remaining.append(entry)
+
+        self.waiters = remaining
+        heapq.heapify(self.waiters)
+        if self.waiters:
+            delay = min(
+                max(
+                    self.buckets[kind].wait_time(),
+                    self.client_bucket.wait_time(1 + index),
+                )
+                for index, (_, _, kind, _) in enumerate(sorted(self.waiters))
+            )
+            self.timer = asyncio.get_running_loop().call_later(delay, self.dispatch)
+
+
+class CallScheduler:
+    """Paces Telegram API calls per client, rerouting reads around FloodWaits"""
+
+    def __init__(self, rates: dict, client_rate: tuple) -> None:
+        self.rates = rates
+        self.client_rate = client_rate
+        self.queues = {}  # client -> ClientQueue
+        self.flood_until = {}  # (client, kind) -> when its FloodWait ends
+        self.stats = {"calls": 0, "flood_waits": 0, "reroutes": 0}
+
+    def get_queue(self, client) -> ClientQueue:
+        if client not in self.queues:
+            self.queues[client] = ClientQueue(self.rates, self.client_rate)
+        return self.queues[client]
+
+    def pick(self, kind: str, clients: list):
+        """The first client not in a FloodWait for `kind`, else the one free soonest"""
+        now = time.monotonic()
+        for client in clients:
+            if self.flood_until.get((client, kind), 0) <= now:
+                return client, 0
+        client = min(clients, key=lambda c: self.flood_until[(c, kind)])
+        return client, self.flood_until[(client, kind)] - now
+
+    async def call(self, kind: str, func, client, pool=None, priority=PRIORITY_BACKGROUND):
+        """Runs `await func(client)` once the client has tokens for `kind`"""
+        clients = [client]
+        if kind in REROUTABLE:
+            clients += [c for c in (pool or []) if c is not client]
+        for attempt in range(FLOOD_RETRIES + 1):
+            target, wait = self.pick(kind, clients)
+            if wait > 0:
+                await asyncio.sleep(wait)
+            if target is not client:
+                self.stats["reroutes"] += 1
+
+            await self.get_queue(target).acquire(kind, priority)
+            self.stats["calls"] += 1
+            try:
+                return await func(target)
+            except FloodWait as e:
+                self.stats["flood_waits"] += 1
+                if attempt == FLOOD_RETRIES:
+                    raise
+                self.flood_until[(target, kind)] = time.monotonic() + e.value
+                logger.warning(f"FloodWait of {e.value}s on '{kind}' calls, rescheduling")
+
+    def get_stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            **self.stats,
+            "flood_waiting": sum(1 for until in self.flood_until.values() if until > now),
+        }
+
+
+SCHEDULER = CallScheduler(METHOD_RATES, CLIENT_RATE)
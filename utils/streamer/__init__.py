@@ -1,10 +1,23 @@
-import math, mimetypes
+import asyncio, heapq, mimetypes, time
+from collections import Counter, OrderedDict, defaultdict
+from contextlib import suppress
+from types import SimpleNamespace
+from pyrogram.file_id import FileId
 from fastapi.responses import StreamingResponse, Response
 from utils.logger import Logger
+from utils.scheduler import SCHEDULER
 from utils.streamer.custom_dl import ByteStreamer
-from utils.streamer.file_properties import get_name
+from utils.streamer.file_properties import get_media_from_message, get_name
 from utils.clients import (
     get_client,
+    get_client_pool,
+    get_idle_client,
+    has_affinity,
+    set_file_affinity,
+    get_stream_client,
+    multi_clients,
+    client_dcs,
+    remember_file_dc,
 )
 from urllib.parse import quote
 
@@ -12,22 +25,173 @@ logger = Logger(__name__)
 
 class_cache = {}
 
+CHUNK_SIZE = 1024 * 1024
 
-async def media_streamer(channel: int, message_id: int, file_name: str, request):
+# Recent files sampled at startup to find the DCs worth pre-warming
+PREWARM_SAMPLE_SIZE = 200
+
+# DCs every client gets an authorized media session for at startup
+PREWARM_DC_COUNT = 2
+
+# Message ids resolved per listing, the most a single get_messages call takes
+WARM_BATCH_SIZE = 200
+
+# A listing page is warmed at most once per this many seconds
+WARM_INTERVAL = 60
+
+# Listing pages remembered for WARM_INTERVAL
+MAX_WARMED_LISTINGS = 10000
+
+warmed_listings = OrderedDict()  # (folder id, cursor) -> when last warmed
+
+
+class Prefetcher:
+    """
+    Pulls an async byte generator in a background task, keeping up to `depth`
+    chunks buffered so the next fetch overlaps with the current emission.
+    """
+
+    _done = object()
+
+    def __init__(self, generator, depth: int = 1) -> None:
+        self.generator = generator
+        self.queue = asyncio.Queue(maxsize=depth)
+        self.task = asyncio.create_task(self._pump())
+
+    async def _pump(self) -> None:
+        try:
+            async for chunk in self.generator:
+                await self.queue.put(chunk)
+            await self.queue.put(self._done)
+        except Exception as e:
+            await self.queue.put(e)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        item = await self.queue.get()
+        if item is self._done:
+            raise StopAsyncIteration
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    async def close(self) -> None:
+        self.task.cancel()
+        with suppress(asyncio.CancelledError, Exception):
+            await self.task
+        await self.generator.aclose()
+
+
+def get_streamer(client) -> ByteStreamer:
     global class_cache
 
-    range_header = request.headers.get("Range", 0)
+    if client in class_cache:
+        return class_cache[client]
 
-    faster_client = get_client()
+    tg_connect = ByteStreamer(client)
+    class_cache[client] = tg_connect
+    return tg_connect
 
-    if faster_client in class_cache:
-        tg_connect = class_cache[faster_client]
-    else:
-        tg_connect = ByteStreamer(faster_client)
-        class_cache[faster_client] = tg_connect
 
-    file_id = await tg_connect.get_file_properties(channel, message_id)
-    file_size = file_id.file_size
+async def stop_streamers() -> None:
+    for tg_connect in class_cache.values():
+        await tg_connect.stop_hedge_sessions()
+
+
+async def get_file_parts(tg_connect: ByteStreamer, channel: int, message_id: int, parts=None):
+    """Resolves the FileId of every storage message backing a drive file"""
+    if not parts:
+        return [await tg_connect.get_file_properties(channel, message_id)]
+
+    return await asyncio.gather(
+        *(tg_connect.get_file_properties(channel, part_id) for part_id, _ in parts)
+    )
+
+
+def yield_part_range(tg_connect: ByteStreamer, file_id, from_bytes: int, until_bytes: int):
+    """Yields bytes from_bytes..until_bytes (inclusive) of a single message"""
+    offset = from_bytes - (from_bytes % CHUNK_SIZE)
+    first_part_cut = from_bytes - offset
+    last_part_cut = until_bytes % CHUNK_SIZE + 1
+    part_count = until_bytes // CHUNK_SIZE - offset // CHUNK_SIZE + 1
+
+    return tg_connect.yield_file(
+        file_id, offset, first_part_cut, last_part_cut, part_count, CHUNK_SIZE
+    )
+
+
+async def yield_range(tg_connect: ByteStreamer, file_ids: list, from_bytes: int, until_bytes: int):
+    """
+    Yields bytes from_bytes..until_bytes (inclusive) of a file stored across one
+    or more messages. The first chunk of the next message is fetched while the
+    current one is still being emitted, so part boundaries don't stall.
+    """
+    ranges = []
+    start = 0
+    for file_id in file_ids:
+        end = start + file_id.file_size - 1
+        if end >= from_bytes and start <= until_bytes:
+            ranges.append(
+                (file_id, max(from_bytes, start) - start, min(until_bytes, end) - start)
+            )
+        start = end + 1
+
+    current = None
+    upcoming = None
+    try:
+        for index, (file_id, part_from, part_until) in enumerate(ranges):
+            current = upcoming or Prefetcher(
+                yield_part_range(tg_connect, file_id, part_from, part_until)
+            )
+            upcoming = None
+
+            if index + 1 < len(ranges):
+                upcoming = Prefetcher(yield_part_range(tg_connect, *ranges[index + 1]))
+
+            async for chunk in current:
+                yield chunk
+            await current.close()
+            current = None
+    finally:
+        for prefetcher in (current, upcoming):
+            if prefetcher is not None:
+                await prefetcher.close()
+
+
+async def leased(body, lease):
+    """Passes a body through, releasing the client's StreamLease when it ends"""
+    try:
+        async for chunk in body:
+            yield chunk
+    finally:
+        lease.release()
+
+
+def immutable_headers(content_id: str) -> dict:
+    """Caching headers of a content-addressed URL, whose bytes never change"""
+    return {
+        "ETag": f'"{content_id}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+
+
+async def media_streamer(
+    channel: int, message_id: int, file_name: str, request, parts=None, content_id=None
+):
+    range_header = request.headers.get("Range", 0)
+
+    faster_client, lease = get_stream_client((channel, message_id))
+    tg_connect = get_streamer(faster_client)
+
+    try:
+        file_ids = await get_file_parts(tg_connect, channel, message_id, parts)
+    except BaseException:
+        lease.release()
+        raise
+    remember_file_dc((channel, message_id), file_ids[0].dc_id)
+    file_size = sum(file_id.file_size for file_id in file_ids)
 
     if range_header:
         from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
@@ -38,24 +202,17 @@ async def media_streamer(channel: int, message_id: int, file_name: str, request)
         until_bytes = file_size - 1
 
     if (until_bytes > file_size) or (from_bytes < 0) or (until_bytes < from_bytes):
+        lease.release()
         return Response(
             status_code=416,
             content="416: Range not satisfiable",
             headers={"Content-Range": f"bytes */{file_size}"},
         )
 
-    chunk_size = 1024 * 1024
     until_bytes = min(until_bytes, file_size - 1)
 
-    offset = from_bytes - (from_bytes % chunk_size)
-    first_part_cut = from_bytes - offset
-    last_part_cut = until_bytes % chunk_size + 1
-
     req_length = until_bytes - from_bytes + 1
-    part_count = math.ceil(until_bytes / chunk_size) - math.floor(offset / chunk_size)
-    body = tg_connect.yield_file(
-        file_id, offset, first_part_cut, last_part_cut, part_count, chunk_size
-    )
+    body = leased(yield_range(tg_connect, file_ids, from_bytes, until_bytes), lease)
 
     disposition = "attachment"
     mime_type = mimetypes.guess_type(file_name.lower())[0] or "application/octet-stream"
@@ -68,15 +225,135 @@ async def media_streamer(channel: int, message_id: int, file_name: str, request)
     ):
         disposition = "inline"
 
+    headers = {
+        "Content-Type": f"{mime_type}",
+        "Content-Range": f"bytes {from_bytes}-{until_bytes}/{file_size}",
+        "Content-Length": str(req_length),
+        "Content-Disposition": f'{disposition}; filename="{quote(file_name)}"',
+        "Accept-Ranges": "bytes",
+    }
+    if content_id:
+        headers.update(immutable_headers(content_id))
+
     return StreamingResponse(
         status_code=206 if range_header else 200,
         content=body,
-        headers={
-            "Content-Type": f"{mime_type}",
-            "Content-Range": f"bytes {from_bytes}-{until_bytes}/{file_size}",
-            "Content-Length": str(req_length),
-            "Content-Disposition": f'{disposition}; filename="{quote(file_name)}"',
-            "Accept-Ranges": "bytes",
-        },
+        headers=headers,
         media_type=mime_type,
     )
+
+
+def should_warm(key) -> bool:
+    """Whether the listing page `key` wasn't warmed within WARM_INTERVAL"""
+    now = time.monotonic()
+    if now - warmed_listings.get(key, -WARM_INTERVAL) < WARM_INTERVAL:
+        return False
+    warmed_listings[key] = now
+    warmed_listings.move_to_end(key)
+    while len(warmed_listings) > MAX_WARMED_LISTINGS:
+        warmed_listings.popitem(last=False)
+    return True
+
+
+async def warm_listing(files: list) -> None:
+    """
+    Resolves the FileIds of the files shown in a listing with one batched
+    get_messages call per storage channel on one client, and points their
+    streams at that client, so opening any of them skips the message lookup.
+    Files whose affinity is still fresh are skipped, which keeps warming on
+    every listing cheap.
+    """
+    by_channel = defaultdict(list)
+    for file in files:
+        if not has_affinity((file.channel, file.file_id)):
+            by_channel[file.channel].append(file)
+    if not by_channel:
+        return
+
+    client_id, client = get_idle_client()
+    budget = WARM_BATCH_SIZE
+    for channel, channel_files in by_channel.items():
+        message_ids = []
+        for file in channel_files:
+            message_ids += [id for id, _ in file.parts] if file.parts else [file.file_id]
+        message_ids = list(dict.fromkeys(message_ids))[:budget]
+        if not message_ids:
+            break
+        budget -= len(message_ids)
+
+        tg_connect = get_streamer(client)
+        try:
+            resolved = await tg_connect.warm_file_properties(channel, message_ids)
+        except Exception as e:
+            logger.warning(f"Failed to warm listing metadata: {e}")
+            continue
+
+        warmed = [
+            (channel, file.file_id) for file in channel_files if file.file_id in message_ids
+        ]
+        set_file_affinity(warmed, client_id)
+        for key in warmed:
+            file_id = tg_connect.cached_file_ids.get(key)
+            if file_id is not None:
+                remember_file_dc(key, file_id.dc_id)
+        logger.debug(f"Warmed {resolved} FileIds on client {client_id}")
+
+
+async def prewarm_media_sessions() -> None:
+    """
+    Learns the DCs of the most recently uploaded files and opens authorized
+    media sessions for the most used ones on every client, so the first
+    stream from those DCs doesn't pay for the authorization export.
+    """
+    from utils.directoryHandler import DRIVE_DATA
+
+    files = []
+
+    def traverse_directory(folder):
+        for item in folder.contents.values():
+            if item.type == "folder":
+                traverse_directory(item)
+            elif not item.trash:
+                files.append(item)
+
+    traverse_directory(DRIVE_DATA.get_directory("/"))
+    recent = heapq.nlargest(PREWARM_SAMPLE_SIZE, files, key=lambda file: file.upload_date)
+    if not recent:
+        return
+
+    by_channel = defaultdict(list)
+    for file in recent:
+        by_channel[file.channel].append(file.file_id)
+
+    dc_counts = Counter()
+    for channel, message_ids in by_channel.items():
+        try:
+            messages = await SCHEDULER.call(
+                "read",
+                lambda client: client.get_messages(channel, message_ids),
+                get_client(),
+                pool=get_client_pool(),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to sample files for media session pre-warming: {e}")
+            continue
+
+        for message in messages:
+            media = get_media_from_message(message)
+            if media:
+                dc_id = FileId.decode(media.file_id).dc_id
+                remember_file_dc((channel, message.id), dc_id)
+                dc_counts[dc_id] += 1
+
+    async def warm(client_id, client):
+        tg_connect = get_streamer(client)
+        for dc_id, _ in dc_counts.most_common(PREWARM_DC_COUNT):
+            if dc_id == client_dcs.get(client_id):
+                continue
+            try:
+                await tg_connect.generate_media_session(client, SimpleNamespace(dc_id=dc_id))
+                logger.info(f"Pre-warmed DC {dc_id} media session of client {client_id}")
+            except Exception as e:
+                logger.warning(f"Failed to pre-warm DC {dc_id} for client {client_id}: {e}")
+
+    await asyncio.gather(*(warm(id, client) for id, client in multi_clients.items()))
@@ -1,33 +1,159 @@
-import asyncio
+import asyncio, time
+from collections import defaultdict, deque
 from typing import Dict, Union
+from config import HEDGED_REQUESTS
 from pyrogram import Client, utils, raw
-from .file_properties import get_file_ids
+from .file_properties import get_file_ids, get_file_ids_from_message
 from pyrogram.session import Session, Auth
-from pyrogram.errors import AuthBytesInvalid
+from pyrogram.errors import AuthBytesInvalid, FileReferenceExpired
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
 from utils.logger import Logger
+from utils.scheduler import PRIORITY_STREAM, SCHEDULER
 
 logger = Logger(__name__)
 
+# GetFile latencies kept per client to derive the hedging deadline
+HEDGE_LATENCY_SAMPLES = 200
+
+# No hedging until this many latencies are known
+HEDGE_MIN_SAMPLES = 20
+
+# Hedge no earlier than this many seconds, whatever the p95
+HEDGE_MIN_DELAY = 0.2
+
+# Hedged requests allowed, as a fraction of all GetFile requests
+HEDGE_BUDGET = 0.05
+
+HEDGE_STATS = {"requests": 0, "hedged": 0, "hedge_wins": 0, "budget_exhausted": 0}
+HEDGE_STATS["no_session"] = 0  # hedges skipped while their session is being created
+
+# How often the FileId cache is swept
+CACHE_CHECK_INTERVAL = 5 * 60
+
+# FileIds unused for this long are dropped
+FILE_ID_IDLE_TIMEOUT = 30 * 60
+
+# FileIds still in use are re-resolved once this old, before their
+# file_reference expires
+FILE_ID_REFRESH_AGE = 45 * 60
+
+# Re-resolutions of an expired file_reference within a single stream
+FILE_REFERENCE_RETRIES = 2
+
 
 class ByteStreamer:
     def __init__(self, client: Client):
-        self.clean_timer = 30 * 60
         self.client: Client = client
-        self.cached_file_ids: Dict[int, FileId] = {}
+        # Keyed by (channel, message_id), message ids are only unique per channel
+        self.cached_file_ids: Dict[tuple, FileId] = {}
+        self.cache_meta: Dict[tuple, list] = {}  # key -> [resolved, used]
+        self.hedge_sessions: Dict[int, Session] = {}
+        self.hedge_locks = defaultdict(asyncio.Lock)
+        self.latencies = deque(maxlen=HEDGE_LATENCY_SAMPLES)
         asyncio.create_task(self.clean_cache())
 
     async def get_file_properties(self, channel, message_id: int) -> FileId:
-        if message_id not in self.cached_file_ids:
+        key = (channel, message_id)
+        if key not in self.cached_file_ids:
             await self.generate_file_properties(channel, message_id)
-        return self.cached_file_ids[message_id]
+        self.cache_meta[key][1] = time.monotonic()
+        return self.cached_file_ids[key]
 
     async def generate_file_properties(self, channel, message_id: int) -> FileId:
         file_id = await get_file_ids(self.client, channel, message_id)
         if not file_id:
             raise Exception("FileNotFound")
-        self.cached_file_ids[message_id] = file_id
-        return self.cached_file_ids[message_id]
+        self.cache_file_id(channel, message_id, file_id)
+        return file_id
+
+    def cache_file_id(self, channel, message_id: int, file_id: FileId) -> None:
+        # Kept on the FileId so an expired file_reference can be re-resolved
+        file_id.channel = channel
+        file_id.message_id = message_id
+
+        key = (channel, message_id)
+        now = time.monotonic()
+        last_used = self.cache_meta.get(key, (None, now))[1]
+        self.cached_file_ids[key] = file_id
+        self.cache_meta[key] = [now, last_used]
+
+    async def warm_file_properties(self, channel, message_ids: list, refresh=False) -> int:
+        """
+        Resolves the FileIds of many messages with one get_messages call (at
+        most 200 ids) ahead of their streams, or re-resolves cached ones with
+        `refresh`. Returns how many were resolved.
+        """
+        missing = [
+            id
+            for id in message_ids
+            if refresh or (channel, id) not in self.cached_file_ids
+        ][:200]
+        if not missing:
+            return 0
+
+        messages = await SCHEDULER.call(
+            "read",
+            lambda client: client.get_messages(channel, missing),
+            self.client,
+            priority=PRIORITY_STREAM,
+        )
+        resolved = 0
+        for message in messages:
+            if message.empty:
+                continue
+            file_id = await get_file_ids_from_message(message)
+            if file_id:
+                self.cache_file_id(channel, message.id, file_id)
+                resolved += 1
+        return resolved
+
+    async def create_media_session(self, client: Client, dc_id: int) -> Session:
+        """
+        Starts a media session for the DC, exporting the client's authorization
+        to it when it isn't the client's home DC.
+        """
+        test_mode = await client.storage.test_mode()
+        if dc_id != await client.storage.dc_id():
+            # FIX: Added False, False for ipv6 and alt_port arguments required by Pyrogram 2.0
+            auth = Auth(client, dc_id, test_mode, False, False)
+
+            media_session = Session(
+                client,
+                dc_id,
+                await auth.create(),
+                test_mode,
+                is_media=True,
+            )
+            await media_session.start()
+
+            for _ in range(6):
+                exported_auth = await client.invoke(
+                    raw.functions.auth.ExportAuthorization(dc_id=dc_id)
+                )
+
+                try:
+                    await media_session.invoke(
+                        raw.functions.auth.ImportAuthorization(
+                            id=exported_auth.id, bytes=exported_auth.bytes
+                        )
+                    )
+                    break
+                except AuthBytesInvalid:
+                    logger.debug(f"Invalid authorization bytes for DC {dc_id}")
+                    continue
+            else:
+                await media_session.stop()
+                raise AuthBytesInvalid
+        else:
+            media_session = Session(
+                client,
+                dc_id,
+                await client.storage.auth_key(),
+                test_mode,
+                is_media=True,
+            )
+            await media_session.start()
+        return media_session
 
     async def generate_media_session(self, client: Client, file_id: FileId) -> Session:
         """
@@ -38,55 +164,100 @@ class ByteStreamer:
         media_session = client.media_sessions.get(file_id.dc_id, None)
 
         if media_session is None:
-            test_mode = await client.storage.test_mode()
-            if file_id.dc_id != await client.storage.dc_id():
-                # FIX: Added False, False for ipv6 and alt_port arguments required by Pyrogram 2.0
-                auth = Auth(client, file_id.dc_id, test_mode, False, False)
-                
-                media_session = Session(
-                    client,
-                    file_id.dc_id,
-                    await auth.create(),
-                    test_mode,
-                    is_media=True,
-                )
-                await media_session.start()
-
-                for _ in range(6):
-                    exported_auth = await client.invoke(
-                        raw.functions.auth.ExportAuthorization(dc_id=file_id.dc_id)
-                    )
-
-                    try:
-                        await media_session.invoke(
-                            raw.functions.auth.ImportAuthorization(
-                                id=exported_auth.id, bytes=exported_auth.bytes
-                            )
-                        )
-                        break
-                    except AuthBytesInvalid:
-                        logger.debug(
-                            f"Invalid authorization bytes for DC {file_id.dc_id}"
-                        )
-                        continue
-                else:
-                    await media_session.stop()
-                    raise AuthBytesInvalid
-            else:
-                media_session = Session(
-                    client,
-                    file_id.dc_id,
-                    await client.storage.auth_key(),
-                    test_mode,
-                    is_media=True,
-                )
-                await media_session.start()
+            media_session = await self.create_media_session(client, file_id.dc_id)
             logger.debug(f"Created media session for DC {file_id.dc_id}")
             client.media_sessions[file_id.dc_id] = media_session
         else:
             logger.debug(f"Using cached media session for DC {file_id.dc_id}")
+
+        if HEDGED_REQUESTS:
+            self.prepare_hedge_session(file_id.dc_id)
+        return media_session
+
+    async def get_hedge_session(self, dc_id: int) -> Session:
+        """Second media session for a DC, so a hedge doesn't queue behind a stall"""
+        async with self.hedge_locks[dc_id]:
+            media_session = self.hedge_sessions.get(dc_id)
+            if media_session is None:
+                media_session = await self.create_media_session(self.client, dc_id)
+                self.hedge_sessions[dc_id] = media_session
+                logger.debug(f"Created hedge media session for DC {dc_id}")
         return media_session
 
+    def prepare_hedge_session(self, dc_id: int) -> None:
+        """Creates the hedge session for a DC in the background, if not there yet"""
+        if dc_id in self.hedge_sessions or self.hedge_locks[dc_id].locked():
+            return
+
+        async def prepare():
+            try:
+                await self.get_hedge_session(dc_id)
+            except Exception as e:
+                logger.warning(f"Failed to create hedge media session for DC {dc_id}: {e}")
+
+        asyncio.create_task(prepare())
+
+    async def stop_hedge_sessions(self) -> None:
+        """Hedge sessions aren't in client.media_sessions, so stopping the client misses them"""
+        for dc_id, media_session in list(self.hedge_sessions.items()):
+            try:
+                await media_session.stop()
+            except Exception as e:
+                logger.warning(f"Failed to stop hedge media session for DC {dc_id}: {e}")
+        self.hedge_sessions.clear()
+
+    def hedge_deadline(self) -> float:
+        latencies = sorted(self.latencies)
+        p95 = latencies[int(len(latencies) * 0.95)]
+        return max(HEDGE_MIN_DELAY, p95)
+
+    async def get_file_chunk(self, media_session: Session, file_id: FileId, location, offset: int, limit: int):
+        """
+        Invokes GetFile for one chunk. With HEDGED_REQUESTS, a chunk that takes
+        longer than the recent p95 latency is requested again over a second
+        session, the first answer wins and the other request is cancelled.
+        """
+        request = raw.functions.upload.GetFile(location=location, offset=offset, limit=limit)
+        HEDGE_STATS["requests"] += 1
+        started = time.monotonic()
+
+        if not HEDGED_REQUESTS or len(self.latencies) < HEDGE_MIN_SAMPLES:
+            r = await media_session.invoke(request)
+            self.latencies.append(time.monotonic() - started)
+            return r
+
+        tasks = [asyncio.create_task(media_session.invoke(request))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_deadline())
+            if not done:
+                if HEDGE_STATS["hedged"] >= HEDGE_BUDGET * HEDGE_STATS["requests"]:
+                    HEDGE_STATS["budget_exhausted"] += 1
+                elif file_id.dc_id not in self.hedge_sessions:
+                    # Creating it here would stall the chunk far past the deadline
+                    HEDGE_STATS["no_session"] += 1
+                    self.prepare_hedge_session(file_id.dc_id)
+                else:
+                    hedge_session = self.hedge_sessions[file_id.dc_id]
+                    tasks.append(asyncio.create_task(hedge_session.invoke(request)))
+                    HEDGE_STATS["hedged"] += 1
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                winner = done.pop()
+                if winner.exception() is None or not pending:
+                    break
+
+            if winner is not tasks[0]:
+                HEDGE_STATS["hedge_wins"] += 1
+            self.latencies.append(time.monotonic() - started)
+            return winner.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
     @staticmethod
     async def get_location(
         file_id: FileId,
@@ -155,12 +326,25 @@ class ByteStreamer:
         current_part = 1
         location = await self.get_location(file_id)
 
+        async def fetch(offset):
+            nonlocal file_id, location
+            for attempt in range(FILE_REFERENCE_RETRIES + 1):
+                try:
+                    return await self.get_file_chunk(
+                        media_session, file_id, location, offset, chunk_size
+                    )
+                except FileReferenceExpired:
+                    message_id = getattr(file_id, "message_id", None)
+                    if attempt == FILE_REFERENCE_RETRIES or message_id is None:
+                        raise
+
+                    # Resume from the same offset with a fresh file_reference
+                    logger.info(f"File reference of message {message_id} expired, refreshing")
+                    file_id = await self.generate_file_properties(file_id.channel, message_id)
+                    location = await self.get_location(file_id)
+
         try:
-            r = await media_session.invoke(
-                raw.functions.upload.GetFile(
-                    location=location, offset=offset, limit=chunk_size
-                ),
-            )
+            r = await fetch(offset)
             if isinstance(r, raw.types.upload.File):
                 while True:
                     chunk = r.bytes
@@ -181,11 +365,7 @@ class ByteStreamer:
                     if current_part > part_count:
                         break
 
-                    r = await media_session.invoke(
-                        raw.functions.upload.GetFile(
-                            location=location, offset=offset, limit=chunk_size
-                        ),
-                    )
+                    r = await fetch(offset)
         except (TimeoutError, AttributeError):
             pass
         finally:
@@ -193,9 +373,27 @@ class ByteStreamer:
 
     async def clean_cache(self) -> None:
         """
-        function to clean the cache to reduce memory usage
+        Drops FileIds that went unused and re-resolves the ones still in use
+        before their file_reference expires, in batches of 200 per channel.
         """
         while True:
-            await asyncio.sleep(self.clean_timer)
-            self.cached_file_ids.clear()
+            await asyncio.sleep(CACHE_CHECK_INTERVAL)
+            now = time.monotonic()
+            stale = defaultdict(list)
+            for key, (resolved, used) in list(self.cache_meta.items()):
+                channel, message_id = key
+                if now - used > FILE_ID_IDLE_TIMEOUT:
+                    del self.cache_meta[key]
+                    self.cached_file_ids.pop(key, None)
+                elif now - resolved > FILE_ID_REFRESH_AGE:
+                    stale[channel].append(message_id)
+
+            for channel, message_ids in stale.items():
+                for start in range(0, len(message_ids), 200):
+                    try:
+                        await self.warm_file_properties(
+                            channel, message_ids[start : start + 200], refresh=True
+                        )
+                    except Exception as e:
+                        logger.warning(f"Failed to refresh cached FileIds: {e}")
             logger.debug("Cleaned the cache")
@@ -4,6 +4,7 @@ from pyrogram.file_id import FileId
 from typing import Any, Optional, Union
 from pyrogram.raw.types.messages import Messages
 from datetime import datetime
+from utils.scheduler import PRIORITY_STREAM, SCHEDULER
 
 
 async def parse_file_id(message: "Message") -> Optional[FileId]:
@@ -19,9 +20,18 @@ async def parse_file_unique_id(message: "Messages") -> Optional[str]:
 
 
 async def get_file_ids(client: Client, chat_id, message_id) -> Optional[FileId]:
-    message = await client.get_messages(chat_id, int(message_id))
+    message = await SCHEDULER.call(
+        "read",
+        lambda c: c.get_messages(chat_id, int(message_id)),
+        client,
+        priority=PRIORITY_STREAM,
+    )
     if message.empty:
         raise Exception("FileNotFound")
+    return await get_file_ids_from_message(message)
+
+
+async def get_file_ids_from_message(message: "Message") -> Optional[FileId]:
     media = get_media_from_message(message)
     file_unique_id = await parse_file_unique_id(message)
     file_id = await parse_file_id(message)
@@ -29,6 +39,7 @@ async def get_file_ids(client: Client, chat_id, message_id) -> Optional[FileId]:
     setattr(file_id, "mime_type", getattr(media, "mime_type", ""))
     setattr(file_id, "file_name", getattr(media, "file_name", ""))
     setattr(file_id, "unique_id", file_unique_id)
+    setattr(file_id, "thumbs", getattr(media, "thumbs", None) or [])
     return file_id
 
 
@@ -0,0 +1,154 @@
+import asyncio, hashlib, mimetypes, os
+from collections import OrderedDict
+from pathlib import Path
+from pyrogram.file_id import FileId
+from utils.clients import get_client
+from utils.logger import Logger
+from utils.streamer import get_streamer, yield_part_range
+
+logger = Logger(__name__)
+
+# Thumbnails kept in memory, by total bytes
+MEMORY_CACHE_SIZE = 32 * 1024 * 1024
+
+# Thumbnails kept on disk, by total bytes. Lives outside ./cache, which is
+# wiped on every start, so previews survive restarts.
+DISK_CACHE_SIZE = 512 * 1024 * 1024
+thumbs_dir = Path("./thumbs")
+
+# Telegram's "m" size, what a grid tile needs
+PREFERRED_THUMB_SIZE = 320
+
+# Concurrent thumbnail fetches of a batch request
+BATCH_CONCURRENCY = 8
+
+NO_THUMB = b""
+
+
+class ThumbCache:
+    """
+    Size-bounded LRU of thumbnail bytes in memory, backed by a larger
+    size-bounded directory on disk. Files without a thumbnail are remembered
+    (as NO_THUMB) in memory only.
+    """
+
+    def __init__(self, directory: Path, memory_size: int, disk_size: int) -> None:
+        self.directory = directory
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.entries = OrderedDict()
+        self.memory_used = 0
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.disk_used = sum(path.stat().st_size for path in self.directory.iterdir())
+
+    def _path(self, key) -> Path:
+        return self.directory / hashlib.sha1(str(key).encode()).hexdigest()
+
+    def _remember(self, key, data: bytes) -> None:
+        if key in self.entries:
+            self.memory_used -= len(self.entries.pop(key))
+        self.entries[key] = data
+        self.memory_used += len(data)
+        while self.memory_used > self.memory_size and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.memory_used -= len(evicted)
+
+    def get(self, key):
+        data = self.entries.get(key)
+        if data is not None:
+            self.entries.move_to_end(key)
+            return data
+
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # disk eviction goes by last use
+        self._remember(key, data)
+        return data
+
+    def put(self, key, data: bytes) -> None:
+        self._remember(key, data)
+        if not data:
+            return
+
+        path = self._path(key)
+        if path.exists():
+            self.disk_used -= path.stat().st_size
+        path.write_bytes(data)
+        self.disk_used += len(data)
+        if self.disk_used > self.disk_size:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        files = sorted(self.directory.iterdir(), key=lambda path: path.stat().st_mtime)
+        for path in files:
+            if self.disk_used <= self.disk_size * 0.9:
+                break
+            size = path.stat().st_size
+            path.unlink(missing_ok=True)
+            self.disk_used -= size
+
+
+THUMB_CACHE = ThumbCache(thumbs_dir, MEMORY_CACHE_SIZE, DISK_CACHE_SIZE)
+
+
+def has_preview(file_name: str) -> bool:
+    mime_type = mimetypes.guess_type(file_name.lower())[0] or ""
+    return mime_type.startswith(("image/", "video/"))
+
+
+def pick_thumb(thumbs: list):
+    """The smallest thumbnail covering PREFERRED_THUMB_SIZE, else the largest"""
+    thumbs = sorted(thumbs, key=lambda thumb: max(thumb.width, thumb.height))
+    for thumb in thumbs:
+        if max(thumb.width, thumb.height) >= PREFERRED_THUMB_SIZE:
+            return thumb
+    return thumbs[-1] if thumbs else None
+
+
+async def get_thumbnail(file) -> bytes:
+    """
+    Returns the JPEG thumbnail Telegram generated for a drive file, or NO_THUMB
+    if it has none. Only the thumbnail is downloaded, never the file itself.
+    """
+    key = (file.channel, file.file_id)
+    data = THUMB_CACHE.get(key)
+    if data is not None:
+        return data
+
+    if not has_preview(file.name):
+        return NO_THUMB
+
+    tg_connect = get_streamer(get_client())
+    file_id = await tg_connect.get_file_properties(file.channel, file.file_id)
+    thumb = pick_thumb(getattr(file_id, "thumbs", []))
+    if thumb is None:
+        THUMB_CACHE.put(key, NO_THUMB)
+        return NO_THUMB
+
+    thumb_id = FileId.decode(thumb.file_id)
+    until_bytes = (thumb.file_size or 512 * 1024) - 1
+    data = b"".join(
+        [chunk async for chunk in yield_part_range(tg_connect, thumb_id, 0, until_bytes)]
+    )
+    THUMB_CACHE.put(key, data)
+    return data
+
+
+async def get_thumbnails(files: dict) -> dict:
+    """Thumbnails of several files ({key: file}) fetched with bounded concurrency"""
+    slots = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def fetch(file):
+        async with slots:
+            try:
+                return await get_thumbnail(file)
+            except Exception as e:
+                logger.warning(f"Failed to fetch thumbnail of {file.name}: {e}")
+                return NO_THUMB
+
+    results = await asyncio.gather(*(fetch(file) for file in files.values()))
+    return dict(zip(files.keys(), results))
@@ -0,0 +1,271 @@
+import mimetypes, struct, zlib
+from collections import OrderedDict
+from fastapi.responses import StreamingResponse, Response
+from utils.clients import get_client
+from utils.logger import Logger
+from utils.streamer import get_file_parts, get_streamer, yield_range
+from urllib.parse import quote
+
+logger = Logger(__name__)
+
+# Parsed central directories of recently opened archives, keyed by
+# (channel, message_id, size)
+INDEX_CACHE = OrderedDict()
+INDEX_CACHE_SIZE = 256
+
+# Most bytes a single decompress call may produce from a deflated member
+INFLATE_CHUNK_SIZE = 1024 * 1024
+
+ZIP64_LIMIT = 0xFFFFFFFF
+MAX_COMMENT = 0xFFFF
+
+END_OF_CENTRAL_DIR = struct.Struct("<IHHHHIIH")
+ZIP64_LOCATOR = struct.Struct("<IIQI")
+ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+
+
+class ZipMember:
+    def __init__(self, name, flags, method, crc, compressed_size, size, offset):
+        self.name = name
+        self.flags = flags
+        self.method = method
+        self.crc = crc
+        self.compressed_size = compressed_size
+        self.size = size
+        self.offset = offset  # of the local header
+        self.data_offset = None  # resolved from the local header on first read
+
+    @property
+    def is_dir(self) -> bool:
+        return self.name.endswith("/")
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "size": self.size,
+            "compressed_size": self.compressed_size,
+            "is_dir": self.is_dir,
+        }
+
+
+async def read_range(tg_connect, file_ids, start: int, length: int) -> bytes:
+    chunks = [
+        chunk async for chunk in yield_range(tg_connect, file_ids, start, start + length - 1)
+    ]
+    return b"".join(chunks)
+
+
+def parse_zip64_extra(extra: bytes, size, compressed_size, offset):
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, length = struct.unpack_from("<HH", extra, position)
+        position += 4
+        if header_id == 1:
+            values = struct.unpack_from(f"<{length // 8}Q", extra, position)
+            values = list(values)
+            if size == ZIP64_LIMIT and values:
+                size = values.pop(0)
+            if compressed_size == ZIP64_LIMIT and values:
+                compressed_size = values.pop(0)
+            if offset == ZIP64_LIMIT and values:
+                offset = values.pop(0)
+            break
+        position += length
+    return size, compressed_size, offset
+
+
+def parse_central_directory(data: bytes, count: int) -> dict:
+    members = OrderedDict()
+    position = 0
+    for _ in range(count):
+        (
+            signature, _, _, flags, method, _, _, crc, compressed_size, size,
+            name_length, extra_length, comment_length, _, _, _, offset,
+        ) = CENTRAL_HEADER.unpack_from(data, position)
+        if signature != 0x02014B50:
+            raise Exception("Corrupt ZIP central directory")
+        position += CENTRAL_HEADER.size
+
+        raw_name = data[position : position + name_length]
+        name = raw_name.decode("utf-8" if flags & 0x800 else "cp437", "replace")
+        position += name_length
+        extra = data[position : position + extra_length]
+        position += extra_length + comment_length
+
+        size, compressed_size, offset = parse_zip64_extra(
+            extra, size, compressed_size, offset
+        )
+        members[name] = ZipMember(
+            name, flags, method, crc, compressed_size, size, offset
+        )
+    return members
+
+
+async def read_index(tg_connect, file_ids, archive_size: int) -> dict:
+    """
+    Locates and parses the central directory with a few ranged reads: the
+    archive tail, the ZIP64 end record if needed, then the directory itself.
+    """
+    tail_length = min(
+        archive_size, END_OF_CENTRAL_DIR.size + MAX_COMMENT + ZIP64_LOCATOR.size
+    )
+    tail_start = archive_size - tail_length
+    tail = await read_range(tg_connect, file_ids, tail_start, tail_length)
+
+    end_position = tail.rfind(b"PK\x05\x06")
+    if end_position < 0:
+        raise Exception("Not a ZIP archive")
+    _, _, _, _, count, directory_size, directory_offset, _ = (
+        END_OF_CENTRAL_DIR.unpack_from(tail, end_position)
+    )
+
+    locator_position = end_position - ZIP64_LOCATOR.size
+    if (
+        locator_position >= 0
+        and tail[locator_position : locator_position + 4] == b"PK\x06\x07"
+    ):
+        _, _, zip64_end_offset, _ = ZIP64_LOCATOR.unpack_from(tail, locator_position)
+        if zip64_end_offset >= tail_start:
+            zip64_end = tail[zip64_end_offset - tail_start :]
+        else:
+            zip64_end = await read_range(
+                tg_connect, file_ids, zip64_end_offset, ZIP64_END.size
+            )
+        signature, _, _, _, _, _, _, count, directory_size, directory_offset = (
+            ZIP64_END.unpack_from(zip64_end)
+        )
+        if signature != 0x06064B50:
+            raise Exception("Corrupt ZIP64 end of central directory")
+
+    if directory_offset >= tail_start:
+        start = directory_offset - tail_start
+        directory = tail[start : start + directory_size]
+    else:
+        directory = await read_range(
+            tg_connect, file_ids, directory_offset, directory_size
+        )
+    return parse_central_directory(directory, count)
+
+
+async def get_zip_index(tg_connect, file):
+    """Returns the FileIds of an archive on the drive and its cached member index"""
+    file_ids = await get_file_parts(tg_connect, file.channel, file.file_id, file.parts)
+    key = (file.channel, file.file_id, file.size)
+
+    members = INDEX_CACHE.get(key)
+    if members is None:
+        archive_size = sum(file_id.file_size for file_id in file_ids)
+        members = await read_index(tg_connect, file_ids, archive_size)
+        INDEX_CACHE[key] = members
+        while len(INDEX_CACHE) > INDEX_CACHE_SIZE:
+            INDEX_CACHE.popitem(last=False)
+    INDEX_CACHE.move_to_end(key)
+    return file_ids, members
+
+
+async def list_zip_members(file) -> list:
+    tg_connect = get_streamer(get_client())
+    _, members = await get_zip_index(tg_connect, file)
+    return [member.to_dict() for member in members.values()]
+
+
+async def yield_member(tg_connect, file_ids, member: ZipMember, from_bytes, until_bytes):
+    """
+    Yields bytes from_bytes..until_bytes (inclusive) of the uncompressed member.
+    Deflated members are always inflated from their start.
+    """
+    if member.data_offset is None:
+        header = await read_range(tg_connect, file_ids, member.offset, LOCAL_HEADER.size)
+        name_length, extra_length = struct.unpack_from("<HH", header, 26)
+        member.data_offset = member.offset + LOCAL_HEADER.size + name_length + extra_length
+
+    if member.method == 0:
+        start = member.data_offset + from_bytes
+        async for chunk in yield_range(
+            tg_connect, file_ids, start, member.data_offset + until_bytes
+        ):
+            yield chunk
+        return
+
+    # Inflated output is bounded chunk by chunk and by the declared size, so a
+    # small member can't expand without limit, and checked against its CRC
+    inflater = zlib.decompressobj(-zlib.MAX_WBITS)
+    end = member.data_offset + member.compressed_size - 1
+    produced = 0
+    crc = 0
+    async for chunk in yield_range(tg_connect, file_ids, member.data_offset, end):
+        while chunk and not inflater.eof:
+            data = inflater.decompress(chunk, INFLATE_CHUNK_SIZE)
+            chunk = inflater.unconsumed_tail
+            produced += len(data)
+            if produced > member.size:
+                raise Exception(f"'{member.name}' inflates past its declared size")
+            crc = zlib.crc32(data, crc)
+            if data:
+                yield data
+        if inflater.eof:
+            break
+
+    if produced != member.size or crc != member.crc:
+        raise Exception(f"'{member.name}' is corrupt, size or CRC-32 mismatch")
+
+
+async def zip_member_streamer(file, member_name: str, request):
+    range_header = request.headers.get("Range", 0)
+
+    tg_connect = get_streamer(get_client())
+    file_ids, members = await get_zip_index(tg_connect, file)
+
+    member = members.get(member_name)
+    if member is None or member.is_dir:
+        raise Exception(f"'{member_name}' not found in archive")
+    if member.flags & 0x1:
+        raise Exception("Encrypted ZIP members are not supported")
+    if member.method not in (0, 8):
+        raise Exception(f"Unsupported ZIP compression method {member.method}")
+
+    file_size = member.size
+    if file_size == 0:
+        return Response(status_code=200, content=b"")
+
+    # Only stored members can start mid-way, deflate streams must be inflated
+    # from the beginning
+    if range_header and member.method == 0:
+        from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
+        from_bytes = int(from_bytes)
+        until_bytes = int(until_bytes) if until_bytes else file_size - 1
+    else:
+        range_header = 0
+        from_bytes = 0
+        until_bytes = file_size - 1
+
+    if (until_bytes > file_size) or (from_bytes < 0) or (until_bytes < from_bytes):
+        return Response(
+            status_code=416,
+            content="416: Range not satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"},
+        )
+
+    until_bytes = min(until_bytes, file_size - 1)
+    req_length = until_bytes - from_bytes + 1
+    body = yield_member(tg_connect, file_ids, member, from_bytes, until_bytes)
+
+    file_name = member_name.rstrip("/").rsplit("/", 1)[-1]
+    mime_type = mimetypes.guess_type(file_name.lower())[0] or "application/octet-stream"
+    headers = {
+        "Content-Type": f"{mime_type}",
+        "Content-Length": str(req_length),
+        "Content-Disposition": f'attachment; filename="{quote(file_name)}"',
+        "Accept-Ranges": "bytes" if member.method == 0 else "none",
+    }
+    if range_header:
+        headers["Content-Range"] = f"bytes {from_bytes}-{until_bytes}/{file_size}"
+
+    return StreamingResponse(
+        status_code=206 if range_header else 200,
+        content=body,
+        headers=headers,
+        media_type=mime_type,
+    )
@@ -0,0 +1,279 @@
+import struct, zlib
+from collections import OrderedDict
+from datetime import datetime
+from fastapi.responses import StreamingResponse, Response
+from utils.clients import get_stream_client
+from utils.logger import Logger
+from utils.streamer import Prefetcher, get_file_parts, get_streamer, leased, yield_range
+from urllib.parse import quote
+
+logger = Logger(__name__)
+
+# CRC-32 of already streamed files, keyed by (channel, message_id, size)
+CRC_CACHE = OrderedDict()
+CRC_CACHE_SIZE = 100000
+
+ZIP64_LIMIT = 0xFFFFFFFF
+VERSION = 45  # ZIP64
+FLAGS = 0x0808  # sizes and CRC in a data descriptor, UTF-8 names
+
+LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+LOCAL_EXTRA = struct.Struct("<HHQQ")
+DATA_DESCRIPTOR = struct.Struct("<IIQQ")
+CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+CENTRAL_EXTRA = struct.Struct("<HHQQQ")
+ZIP64_END = struct.Struct("<IQHHIIQQQQ")
+ZIP64_LOCATOR = struct.Struct("<IIQI")
+END_OF_CENTRAL_DIR = struct.Struct("<IHHHHIIH")
+
+
+def dos_date_time(upload_date: str):
+    try:
+        date = datetime.strptime(upload_date, "%Y-%m-%d %H:%M:%S")
+    except (TypeError, ValueError):
+        date = datetime.now()
+    date = max(date, datetime(1980, 1, 1))
+    dos_time = (date.hour << 11) | (date.minute << 5) | (date.second // 2)
+    dos_date = ((date.year - 1980) << 9) | (date.month << 5) | date.day
+    return dos_time, dos_date
+
+
+class ZipEntry:
+    def __init__(self, name: str, item) -> None:
+        self.name = name.encode()
+        self.file = item if item.type == "file" else None
+        self.size = item.size if self.file else 0
+        self.time, self.date = dos_date_time(item.upload_date)
+        self.offset = 0
+        # Taken once, so cache evictions can't change it while the archive streams
+        self._crc = CRC_CACHE.get(self.crc_key) if self.file and self.size else 0
+
+    @property
+    def crc_key(self):
+        return (self.file.channel, self.file.file_id, self.size)
+
+    @property
+    def crc(self):
+        return self._crc
+
+    def set_crc(self, crc: int) -> None:
+        self._crc = crc
+        CRC_CACHE[self.crc_key] = crc
+        CRC_CACHE.move_to_end(self.crc_key)
+        while len(CRC_CACHE) > CRC_CACHE_SIZE:
+            CRC_CACHE.popitem(last=False)
+
+    def local_header(self) -> bytes:
+        header = LOCAL_HEADER.pack(
+            0x04034B50, VERSION, FLAGS, 0, self.time, self.date,
+            0, ZIP64_LIMIT, ZIP64_LIMIT, len(self.name), LOCAL_EXTRA.size,
+        )
+        return header + self.name + LOCAL_EXTRA.pack(1, 16, 0, 0)
+
+    def data_descriptor(self) -> bytes:
+        return DATA_DESCRIPTOR.pack(0x08074B50, self.crc, self.size, self.size)
+
+    def central_header(self) -> bytes:
+        is_dir = self.file is None
+        header = CENTRAL_HEADER.pack(
+            0x02014B50, VERSION, VERSION, FLAGS, 0, self.time, self.date,
+            self.crc, ZIP64_LIMIT, ZIP64_LIMIT, len(self.name), CENTRAL_EXTRA.size,
+            0, 0, 0, 0x10 if is_dir else 0, ZIP64_LIMIT,
+        )
+        extra = CENTRAL_EXTRA.pack(1, 24, self.size, self.size, self.offset)
+        return header + self.name + extra
+
+    @property
+    def local_length(self) -> int:
+        return LOCAL_HEADER.size + len(self.name) + LOCAL_EXTRA.size
+
+    @property
+    def central_length(self) -> int:
+        return CENTRAL_HEADER.size + len(self.name) + CENTRAL_EXTRA.size
+
+
+def collect_entries(folder) -> list:
+    """Entries for every non-trashed item below `folder`, paths relative to it"""
+    entries = []
+    used_names = set()
+
+    def unique_name(name: str) -> str:
+        stem, dot, ext = name.rpartition(".")
+        if not stem or name.endswith("/"):
+            stem, dot, ext = name, "", ""
+        candidate, count = name, 1
+        while candidate in used_names:
+            candidate = f"{stem} ({count}){dot}{ext}"
+            count += 1
+        used_names.add(candidate)
+        return candidate
+
+    def traverse(folder, prefix: str):
+        for item in folder.contents.values():
+            if item.trash:
+                continue
+            name = prefix + item.name.replace("/", "_")
+            if item.type == "folder":
+                name = unique_name(name + "/")
+                entries.append(ZipEntry(name, item))
+                traverse(item, name)
+            else:
+                entries.append(ZipEntry(unique_name(name), item))
+
+    traverse(folder, "")
+    return entries
+
+
+class ZipLayout:
+    """Byte layout of a store-mode ZIP64 archive, known upfront from the file sizes"""
+
+    def __init__(self, entries: list) -> None:
+        self.entries = entries
+        self.segments = []  # (offset, length, kind, entry)
+
+        offset = 0
+        for entry in entries:
+            entry.offset = offset
+            for kind, length in (
+                ("header", entry.local_length),
+                ("data", entry.size),
+                ("descriptor", DATA_DESCRIPTOR.size),
+            ):
+                if length:
+                    self.segments.append((offset, length, kind, entry))
+                offset += length
+
+        self.central_offset = offset
+        self.central_length = sum(entry.central_length for entry in entries)
+        tail_length = (
+            self.central_length
+            + ZIP64_END.size
+            + ZIP64_LOCATOR.size
+            + END_OF_CENTRAL_DIR.size
+        )
+        self.segments.append((offset, tail_length, "tail", None))
+        self.total_size = offset + tail_length
+
+    def tail(self) -> bytes:
+        central = b"".join(entry.central_header() for entry in self.entries)
+        zip64_end_offset = self.central_offset + len(central)
+        count = len(self.entries)
+        return (
+            central
+            + ZIP64_END.pack(
+                0x06064B50, ZIP64_END.size - 12, VERSION, VERSION, 0, 0,
+                count, count, len(central), self.central_offset,
+            )
+            + ZIP64_LOCATOR.pack(0x07064B50, 0, zip64_end_offset, 1)
+            + END_OF_CENTRAL_DIR.pack(
+                0x06054B50, 0, 0, 0xFFFF, 0xFFFF, ZIP64_LIMIT, ZIP64_LIMIT, 0
+            )
+        )
+
+
+async def file_bytes(tg_connect, entry: ZipEntry, from_bytes, until_bytes):
+    """Yields bytes from_bytes..until_bytes (inclusive) of the file of an entry"""
+    file = entry.file
+    file_ids = await get_file_parts(tg_connect, file.channel, file.file_id, file.parts)
+    if sum(file_id.file_size for file_id in file_ids) != entry.size:
+        raise Exception(f"Size of '{file.name}' on Telegram doesn't match the drive")
+
+    async for chunk in yield_range(tg_connect, file_ids, from_bytes, until_bytes):
+        yield chunk
+
+
+async def yield_zip(tg_connect, layout: ZipLayout, from_bytes, until_bytes):
+    """Yields bytes from_bytes..until_bytes (inclusive) of the archive"""
+    segments = []
+    for offset, length, kind, entry in layout.segments:
+        end = offset + length - 1
+        if end >= from_bytes and offset <= until_bytes:
+            start = max(from_bytes, offset) - offset
+            segments.append((kind, entry, start, min(until_bytes, end) - offset))
+
+    data_segments = [index for index, segment in enumerate(segments) if segment[0] == "data"]
+
+    def start_fetch(index):
+        _, entry, start, end = segments[index]
+        return Prefetcher(file_bytes(tg_connect, entry, start, end))
+
+    upcoming = {}
+    try:
+        for index, (kind, entry, start, end) in enumerate(segments):
+            if kind == "header":
+                yield entry.local_header()[start : end + 1]
+            elif kind == "data":
+                current = upcoming.pop(index, None) or start_fetch(index)
+                following = [i for i in data_segments if i > index][:1]
+                for next_index in following:
+                    upcoming[next_index] = start_fetch(next_index)
+
+                # The CRC is only known if the whole file passes through here
+                whole = start == 0 and end == entry.size - 1 and entry.crc is None
+                crc = 0
+                async for chunk in current:
+                    if whole:
+                        crc = zlib.crc32(chunk, crc)
+                    yield chunk
+                await current.close()
+                if whole:
+                    entry.set_crc(crc)
+            elif kind == "descriptor":
+                if entry.crc is None:
+                    raise Exception(f"CRC of '{entry.file.name}' is unknown")
+                yield entry.data_descriptor()[start : end + 1]
+            else:
+                yield layout.tail()[start : end + 1]
+    finally:
+        for prefetcher in upcoming.values():
+            await prefetcher.close()
+
+
+async def zip_streamer(folder, request):
+    range_header = request.headers.get("Range", 0)
+
+    layout = ZipLayout(collect_entries(folder))
+    file_size = layout.total_size
+
+    # Ranges need every CRC, else the whole archive is sent and they are learned
+    ranges_allowed = all(entry.crc is not None for entry in layout.entries)
+    if not ranges_allowed:
+        range_header = 0
+
+    if range_header:
+        from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
+        from_bytes = int(from_bytes)
+        until_bytes = int(until_bytes) if until_bytes else file_size - 1
+    else:
+        from_bytes = 0
+        until_bytes = file_size - 1
+
+    if (until_bytes > file_size) or (from_bytes < 0) or (until_bytes < from_bytes):
+        return Response(
+            status_code=416,
+            content="416: Range not satisfiable",
+            headers={"Content-Range": f"bytes */{file_size}"},
+        )
+
+    until_bytes = min(until_bytes, file_size - 1)
+    req_length = until_bytes - from_bytes + 1
+
+    client, lease = get_stream_client(("zip", folder.id))
+    tg_connect = get_streamer(client)
+    body = leased(yield_zip(tg_connect, layout, from_bytes, until_bytes), lease)
+
+    file_name = f"{folder.name if folder.id != 'root' else 'TG Drive'}.zip"
+    headers = {
+        "Content-Type": "application/zip",
+        "Content-Length": str(req_length),
+        "Content-Disposition": f'attachment; filename="{quote(file_name)}"',
+        "Accept-Ranges": "bytes" if ranges_allowed else "none",
+    }
+    if range_header:
+        headers["Content-Range"] = f"bytes {from_bytes}-{until_bytes}/{file_size}"
+    return StreamingResponse(
+        status_code=206 if range_header else 200,
+        content=body,
+        headers=headers,
+        media_type="application/zip",
+    )
@@ -0,0 +1,160 @@
+import json, time
+import aiofiles
+from pathlib import Path
+from utils.logger import Logger
+
+logger = Logger(__name__)
+
+# Partial files and their session metadata, outside ./cache which is wiped on
+# every start, so uploads can resume after a restart
+uploads_dir = Path("./uploads")
+uploads_dir.mkdir(parents=True, exist_ok=True)
+
+# Sessions idle for longer than this are discarded along with their partial file
+SESSION_TTL = 24 * 60 * 60
+
+UPLOAD_SESSIONS = {}
+
+
+class UploadSession:
+    """
+    Server side state of a resumable upload. Chunks may arrive in any order
+    and in parallel, each one is written at its own offset of a preallocated
+    file and the received byte ranges are tracked until the file is complete.
+    """
+
+    def __init__(
+        self, id: str, path: str, filename: str, total_size: int, ranges: list = None
+    ) -> None:
+        self.id = id
+        self.path = path
+        self.filename = filename
+        self.total_size = total_size
+        self.ranges = ranges or []  # sorted, non overlapping [start, end) byte ranges
+        self.finalized = False
+        self.last_active = time.time()
+
+        ext = filename.lower().split(".")[-1] if "." in filename else "bin"
+        self.file_location = uploads_dir / f"{id}.{ext}"
+        self.meta_location = uploads_dir / f"{id}.json"
+        if ranges is None:
+            with open(self.file_location, "wb") as f:
+                f.truncate(total_size)
+            self.save()
+
+    def save(self) -> None:
+        meta = {
+            "id": self.id,
+            "path": self.path,
+            "filename": self.filename,
+            "total_size": self.total_size,
+            "ranges": self.ranges,
+        }
+        self.meta_location.write_text(json.dumps(meta))
+
+    @property
+    def received(self) -> int:
+        return sum(end - start for start, end in self.ranges)
+
+    @property
+    def committed_offset(self) -> int:
+        """End of the contiguous range received from byte 0"""
+        if self.ranges and self.ranges[0][0] == 0:
+            return self.ranges[0][1]
+        return 0
+
+    @property
+    def is_complete(self) -> bool:
+        return self.ranges == [[0, self.total_size]]
+
+    def _add_range(self, start: int, end: int) -> None:
+        ranges = []
+        for r in sorted(self.ranges + [[start, end]]):
+            if ranges and r[0] <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], r[1])
+            else:
+                ranges.append(r)
+        self.ranges = ranges
+
+    async def write_chunk(self, offset: int, file) -> None:
+        if self.finalized:
+            raise Exception("Upload already finalized")
+
+        position = offset
+        async with aiofiles.open(self.file_location, "r+b") as buffer:
+            await buffer.seek(offset)
+            while chunk := await file.read(1024 * 1024):
+                if position + len(chunk) > self.total_size:
+                    raise Exception("Chunk exceeds declared file size")
+                await buffer.write(chunk)
+                position += len(chunk)
+
+        if position > offset:
+            self._add_range(offset, position)
+            self.save()
+        self.last_active = time.time()
+
+    def state(self) -> dict:
+        return {
+            "id": self.id,
+            "total_size": self.total_size,
+            "received": self.received,
+            "committed_offset": self.committed_offset,
+            "ranges": self.ranges,
+            "finalized": self.finalized,
+        }
+
+    def discard(self) -> None:
+        self.file_location.unlink(missing_ok=True)
+        self.meta_location.unlink(missing_ok=True)
+
+    def finalize(self) -> None:
+        """Ends the session, its file now belongs to the uploader"""
+        self.finalized = True
+        self.meta_location.unlink(missing_ok=True)
+        UPLOAD_SESSIONS.pop(self.id, None)
+
+
+def create_upload_session(id: str, path: str, filename: str, total_size: int):
+    clean_upload_sessions()
+
+    session = UPLOAD_SESSIONS.get(id)
+    if session is not None:
+        # Resuming, keep the chunks that were already received
+        session.last_active = time.time()
+        return session
+
+    session = UploadSession(id, path, filename, total_size)
+    UPLOAD_SESSIONS[id] = session
+    logger.info(f"Created upload session {id} for {filename} ({total_size} bytes)")
+    return session
+
+
+def clean_upload_sessions() -> None:
+    now = time.time()
+    for id, session in list(UPLOAD_SESSIONS.items()):
+        if now - session.last_active > SESSION_TTL:
+            session.discard()
+            del UPLOAD_SESSIONS[id]
+            logger.info(f"Discarded expired upload session {id}")
+
+
+def load_upload_sessions() -> None:
+    """Restores the sessions of uploads that were interrupted by a restart"""
+    for meta_location in uploads_dir.glob("*.json"):
+        try:
+            meta = json.loads(meta_location.read_text())
+            session = UploadSession(
+                meta["id"], meta["path"], meta["filename"], meta["total_size"], meta["ranges"]
+            )
+            if not session.file_location.exists():
+                raise Exception("Partial file is missing")
+        except Exception as e:
+            logger.warning(f"Dropping upload session {meta_location.name}: {e}")
+            meta_location.unlink(missing_ok=True)
+            continue
+
+        session.last_active = meta_location.stat().st_mtime
+        UPLOAD_SESSIONS[session.id] = session
+    clean_upload_sessions()
+    logger.info(f"Restored {len(UPLOAD_SESSIONS)} upload sessions")
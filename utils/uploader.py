@@ -1,21 +1,84 @@
 from utils.clients import get_client
-from pyrogram import Client
+from pyrogram import Client, raw
+from pyrogram.session import Session
 from pyrogram.types import Message
-from config import STORAGE_CHANNEL
-import os
+from config import TELEGRAM_FILE_SIZE_LIMIT
+import asyncio, hashlib, io, math, mimetypes, os
+from utils.jobs import JOBS
 from utils.logger import Logger
+from utils.placement import pick_storage_channel
+from utils.scheduler import PRIORITY_UPLOAD, SCHEDULER
 from urllib.parse import unquote_plus
 
 logger = Logger(__name__)
-PROGRESS_CACHE = {}
-STOP_TRANSMISSION = []
 
+# Size of a single SaveFilePart/SaveBigFilePart request, as used by Pyrogram
+UPLOAD_PART_SIZE = 512 * 1024
 
-async def progress_callback(current, total, id, client: Client, file_path):
-    global PROGRESS_CACHE, STOP_TRANSMISSION
+# Parts uploaded concurrently over the media session of a streamed upload
+UPLOAD_WORKERS = 4
 
-    PROGRESS_CACHE[id] = ("running", current, total)
-    if id in STOP_TRANSMISSION:
+
+class FileSlice(io.RawIOBase):
+    """
+    Read-only view over a byte range of a file on disk, so a part of an oversize
+    file can be handed to Pyrogram without copying it to a separate file.
+    """
+
+    def __init__(self, file_path, offset: int, length: int, name: str) -> None:
+        self.fp = open(file_path, "rb")
+        self.offset = offset
+        self.length = length
+        self.position = 0
+        self.name = name
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_SET:
+            position = offset
+        elif whence == os.SEEK_CUR:
+            position = self.position + offset
+        else:
+            position = self.length + offset
+        self.position = max(0, min(position, self.length))
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        remaining = self.length - self.position
+        if size is None or size < 0 or size > remaining:
+            size = remaining
+        self.fp.seek(self.offset + self.position)
+        data = self.fp.read(size)
+        self.position += len(data)
+        return data
+
+    def close(self) -> None:
+        self.fp.close()
+        super().close()
+
+
+def hash_file(file_path, chunk_size=1024 * 1024) -> str:
+    """Returns the content key ("sha256:<hex>") of a file on disk"""
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return f"sha256:{hasher.hexdigest()}"
+
+
+async def progress_callback(
+    current, total, id, client: Client, file_path, offset=0, grand_total=None
+):
+    JOBS.update(id, "upload", "running", offset + current, grand_total or total)
+    if JOBS.is_cancelled(id):
         logger.info(f"Stopping transmission {id}")
         client.stop_transmission()
         try:
@@ -24,46 +87,333 @@ async def progress_callback(current, total, id, client: Client, file_path):
             pass
 
 
-async def start_file_uploader(
-    file_path, id, directory_path, filename, file_size, delete=True
-):
-    global PROGRESS_CACHE
-    from utils.directoryHandler import DRIVE_DATA
+async def upload_message(
+    file_path, id, size, channel, document=None, offset=0, grand_total=None
+) -> Message:
+    # Use premium client for files larger than 2 GB
+    premium_required = size > 1.98 * 1024 * 1024 * 1024
+    client: Client = get_client(premium_required=premium_required)
+
+    return await SCHEDULER.call(
+        "send",
+        lambda client: client.send_document(
+            channel,
+            document or file_path,
+            progress=progress_callback,
+            progress_args=(id, client, file_path, offset, grand_total),
+            disable_notification=True,
+        ),
+        client,
+        priority=PRIORITY_UPLOAD,
+    )
 
-    logger.info(f"Uploading file {file_path} {id}")
 
-    if file_size > 1.98 * 1024 * 1024 * 1024:
+async def upload_stream(
+    reader, id, file_name, size, channel, offset=0, grand_total=None
+) -> Message:
+    """
+    Uploads `size` bytes read from `reader` as one document in the storage
+    `channel`. Unlike send_document, parts are sent to Telegram as soon as they
+    are read, so the data never has to exist as a file on disk.
+    """
+    if size > 1.98 * 1024 * 1024 * 1024:
         # Use premium client for files larger than 2 GB
         client: Client = get_client(premium_required=True)
     else:
         client: Client = get_client()
 
-    PROGRESS_CACHE[id] = ("running", 0, 0)
+    is_big = size > 10 * 1024 * 1024
+    total_parts = max(1, math.ceil(size / UPLOAD_PART_SIZE))
+    upload_id = client.rnd_id()
+    md5 = None if is_big else hashlib.md5()
+
+    session = Session(
+        client,
+        await client.storage.dc_id(),
+        await client.storage.auth_key(),
+        await client.storage.test_mode(),
+        is_media=True,
+    )
+    await session.start()
+
+    queue = asyncio.Queue(maxsize=UPLOAD_WORKERS * 2)
+    uploaded = 0
+    errors = []
+
+    async def worker():
+        nonlocal uploaded
+        while (item := await queue.get()) is not None:
+            if errors:
+                continue  # keep draining so the producer never blocks
+
+            part, chunk = item
+            if is_big:
+                rpc = raw.functions.upload.SaveBigFilePart(
+                    file_id=upload_id,
+                    file_part=part,
+                    file_total_parts=total_parts,
+                    bytes=chunk,
+                )
+            else:
+                rpc = raw.functions.upload.SaveFilePart(
+                    file_id=upload_id, file_part=part, bytes=chunk
+                )
+
+            try:
+                await session.invoke(rpc)
+            except Exception as e:
+                errors.append(e)
+                continue
 
-    message: Message = await client.send_document(
-        STORAGE_CHANNEL,
-        file_path,
-        progress=progress_callback,
-        progress_args=(id, client, file_path),
-        disable_notification=True,
+            uploaded += len(chunk)
+            JOBS.update(
+                id, "upload", "running", offset + uploaded, grand_total or size
+            )
+
+    workers = [asyncio.create_task(worker()) for _ in range(UPLOAD_WORKERS)]
+    try:
+        for part in range(total_parts):
+            if errors:
+                raise errors[0]
+            if JOBS.is_cancelled(id):
+                raise Exception("Upload cancelled")
+
+            chunk = await reader.read(
+                min(UPLOAD_PART_SIZE, size - part * UPLOAD_PART_SIZE)
+            )
+            if md5:
+                md5.update(chunk)
+            await queue.put((part, chunk))
+
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+        if errors:
+            raise errors[0]
+    finally:
+        for task in workers:
+            task.cancel()
+        await session.stop()
+
+    if is_big:
+        input_file = raw.types.InputFileBig(
+            id=upload_id, parts=total_parts, name=file_name
+        )
+    else:
+        input_file = raw.types.InputFile(
+            id=upload_id, parts=total_parts, name=file_name, md5_checksum=md5.hexdigest()
+        )
+
+    # The uploaded parts belong to this client, so a FloodWait is waited out
+    send_media = raw.functions.messages.SendMedia(
+        peer=await client.resolve_peer(channel),
+        media=raw.types.InputMediaUploadedDocument(
+            mime_type=mimetypes.guess_type(file_name)[0] or "application/octet-stream",
+            file=input_file,
+            attributes=[raw.types.DocumentAttributeFilename(file_name=file_name)],
+        ),
+        silent=True,
+        random_id=client.rnd_id(),
+        message="",
     )
-    size = (
+    r = await SCHEDULER.call(
+        "send", lambda c: c.invoke(send_media), client, priority=PRIORITY_UPLOAD
+    )
+
+    for update in r.updates:
+        if isinstance(update, raw.types.UpdateNewChannelMessage):
+            return await SCHEDULER.call(
+                "read",
+                lambda c: c.get_messages(channel, update.message.id),
+                client,
+                priority=PRIORITY_UPLOAD,
+            )
+    raise Exception("Uploaded document message not found")
+
+
+def get_message_media(message: Message):
+    return (
         message.photo
         or message.document
         or message.video
         or message.audio
         or message.sticker
-    ).file_size
+    )
+
+
+async def start_file_uploader(
+    file_path, id, directory_path, filename, file_size, delete=True, file_hash=None
+):
+    from utils.directoryHandler import DRIVE_DATA
+
+    logger.info(f"Uploading file {file_path} {id}")
 
     filename = unquote_plus(filename)
 
-    DRIVE_DATA.new_file(directory_path, filename, message.id, size)
-    PROGRESS_CACHE[id] = ("completed", size, size)
+    if file_hash is None:
+        file_hash = await asyncio.to_thread(hash_file, file_path)
+
+    duplicate = DRIVE_DATA.find_duplicate(file_hash)
+    if duplicate:
+        # Same content is already stored on Telegram, reuse its message
+        message_id, size, parts, channel = duplicate
+        logger.info(f"Duplicate of message {message_id} found for {id}, skipping upload")
+        DRIVE_DATA.new_file(
+            directory_path,
+            filename,
+            message_id,
+            size,
+            file_hash,
+            parts=parts,
+            channel=channel,
+        )
+        JOBS.update(id, "upload", "completed", size, size)
+    elif file_size > TELEGRAM_FILE_SIZE_LIMIT:
+        JOBS.update(id, "upload", "running", 0, file_size)
+
+        # All parts of a file share one channel
+        channel = pick_storage_channel(file_size)
+
+        part_size = int(TELEGRAM_FILE_SIZE_LIMIT)
+        part_count = math.ceil(file_size / part_size)
+        parts = []
+        logger.info(f"Splitting {file_path} {id} into {part_count} parts")
 
-    logger.info(f"Uploaded file {file_path} {id}")
+        for index in range(part_count):
+            offset = index * part_size
+            length = min(part_size, file_size - offset)
+            part = FileSlice(
+                file_path, offset, length, f"{filename}.part{index + 1:03d}"
+            )
+            try:
+                message = await upload_message(
+                    file_path, id, length, channel, part, offset, file_size
+                )
+            finally:
+                part.close()
+
+            if message is None:
+                logger.info(f"Upload of {file_path} {id} was stopped")
+                return
+            parts.append((message.id, get_message_media(message).file_size))
+
+        size = sum(length for _, length in parts)
+        DRIVE_DATA.new_file(
+            directory_path,
+            filename,
+            parts[0][0],
+            size,
+            file_hash,
+            parts=parts,
+            channel=channel,
+        )
+        JOBS.update(id, "upload", "completed", size, size)
+
+        logger.info(f"Uploaded file {file_path} {id} in {part_count} parts")
+    else:
+        JOBS.update(id, "upload", "running", 0, 0)
+
+        channel = pick_storage_channel(file_size)
+        message = await upload_message(file_path, id, file_size, channel)
+        if message is None:
+            logger.info(f"Upload of {file_path} {id} was stopped")
+            return
+        media = get_message_media(message)
+        size = media.file_size
+
+        DRIVE_DATA.new_file(
+            directory_path,
+            filename,
+            message.id,
+            size,
+            file_hash,
+            media.file_unique_id,
+            channel=channel,
+        )
+        JOBS.update(id, "upload", "completed", size, size)
+
+        logger.info(f"Uploaded file {file_path} {id}")
 
     if delete:
         try:
             os.remove(file_path)
         except Exception as e:
             pass
+
+
+async def start_stream_uploader(reader, id, directory_path, filename, file_size):
+    """
+    Uploads a file of known size straight from an ordered byte `reader`,
+    splitting it across messages when it exceeds the Telegram limit. The hash
+    is only known once all bytes went by, so a duplicate is detected after the
+    upload, and the new messages are deleted in favour of the stored ones.
+    """
+    from utils.directoryHandler import DRIVE_DATA
+
+    logger.info(f"Streaming upload {id} ({file_size} bytes)")
+
+    filename = unquote_plus(filename)
+    JOBS.update(id, "upload", "running", 0, file_size)
+
+    part_size = int(TELEGRAM_FILE_SIZE_LIMIT)
+    part_count = max(1, math.ceil(file_size / part_size))
+    channel = pick_storage_channel(file_size)
+    parts = []
+    for index in range(part_count):
+        offset = index * part_size
+        length = min(part_size, file_size - offset)
+        name = filename if part_count == 1 else f"{filename}.part{index + 1:03d}"
+
+        message = await upload_stream(
+            reader, id, name, length, channel, offset, file_size
+        )
+        media = get_message_media(message)
+        parts.append((message.id, media.file_size))
+
+    size = sum(length for _, length in parts)
+    duplicate = DRIVE_DATA.find_duplicate(reader.file_hash)
+    if duplicate:
+        message_id, size, duplicate_parts, duplicate_channel = duplicate
+        logger.info(f"Duplicate of message {message_id} found for {id}, dropping upload")
+        DRIVE_DATA.new_file(
+            directory_path,
+            filename,
+            message_id,
+            size,
+            reader.file_hash,
+            parts=duplicate_parts,
+            channel=duplicate_channel,
+        )
+        try:
+            await SCHEDULER.call(
+                "edit",
+                lambda client: client.delete_messages(
+                    channel, [message_id for message_id, _ in parts]
+                ),
+                get_client(),
+            )
+        except Exception as e:
+            logger.warning(f"Failed to delete duplicate upload {id}: {e}")
+    elif part_count == 1:
+        DRIVE_DATA.new_file(
+            directory_path,
+            filename,
+            message.id,
+            size,
+            reader.file_hash,
+            media.file_unique_id,
+            channel=channel,
+        )
+    else:
+        DRIVE_DATA.new_file(
+            directory_path,
+            filename,
+            parts[0][0],
+            size,
+            reader.file_hash,
+            parts=parts,
+            channel=channel,
+        )
+    JOBS.update(id, "upload", "completed", size, size)
+
+    logger.info(f"Uploaded stream {id} in {part_count} parts")